@@ -2,14 +2,24 @@
 配置管理 - 增强版 (紧急重复提醒 + 巨量挂单)
 """
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 from enum import Enum
+import asyncio
+import functools
 import json
+from itertools import islice
 import os
-from datetime import datetime, timezone, timedelta
+import sqlite3
+import sys
+from datetime import datetime, time, timezone, timedelta
 from loguru import logger
 
 
+# 用户数据写盘合并窗口 (秒)
+SAVE_DEBOUNCE = 0.1
+# 写盘失败后的重试间隔 (秒)
+SAVE_RETRY_DELAY = 5.0
+
 # 常用时区
 TIMEZONE_PRESETS = {
     "UTC": 0,
@@ -26,6 +36,24 @@ TIMEZONE_PRESETS = {
 }
 
 
+@functools.lru_cache(maxsize=64)
+def _parse_hhmm(value: str) -> time:
+    """解析 "HH:MM"，夜间时段只有少数几种取值，缓存解析结果"""
+    return datetime.strptime(value, "%H:%M").time()
+
+
+@functools.lru_cache(maxsize=4096)
+def _strip_usdt(symbol: str) -> str:
+    """去掉 USDT 后缀得到币种名 (驻留字符串，每个交易对只分配一次)"""
+    return sys.intern(symbol[:-4] if symbol.endswith('USDT') else symbol)
+
+
+@functools.lru_cache(maxsize=64)
+def _fixed_tz(offset: int) -> timezone:
+    """按小时偏移复用 tzinfo 对象"""
+    return timezone(timedelta(hours=offset))
+
+
 class AlertProfile(Enum):
     CONSERVATIVE = "conservative"
     MODERATE = "moderate"
@@ -210,22 +238,21 @@ class UserConfig:
         symbol = symbol.upper()
         
         # 黑名单始终生效
-        if symbol in self.blacklist:
+        blacklist = self.blacklist
+        if symbol in blacklist:
             return False
-        for blocked in self.blacklist:
-            blocked_base = blocked.replace('USDT', '')
-            symbol_base = symbol.replace('USDT', '')
-            if symbol_base == blocked_base:
+        symbol_base = _strip_usdt(symbol)
+        for blocked in blacklist:
+            if _strip_usdt(blocked) == symbol_base:
                 return False
         
         # 白名单模式
         if self.watch_mode == "whitelist":
-            if symbol in self.whitelist:
+            whitelist = self.whitelist
+            if symbol in whitelist:
                 return True
-            for allowed in self.whitelist:
-                allowed_base = allowed.replace('USDT', '')
-                symbol_base = symbol.replace('USDT', '')
-                if symbol_base == allowed_base:
+            for allowed in whitelist:
+                if _strip_usdt(allowed) == symbol_base:
                     return True
             return False
         
@@ -251,26 +278,28 @@ class UserConfig:
         return f"≥${v:.0f}"
     
     def get_local_time(self, utc_time: datetime = None) -> datetime:
-        """将时间转换为用户时区"""
+        """将时间转换为用户时区 (已是用户时区的时间原样返回)"""
+        user_tz = _fixed_tz(self.timezone_offset)
         if utc_time is None:
-            utc_time = datetime.now(timezone.utc)
-        elif utc_time.tzinfo is None:
+            return datetime.now(user_tz)
+        if utc_time.tzinfo is None:
             return utc_time + timedelta(hours=self.timezone_offset)
-        user_tz = timezone(timedelta(hours=self.timezone_offset))
         return utc_time.astimezone(user_tz)
     
     def get_local_time_str(self, utc_time: datetime = None, fmt: str = "%Y-%m-%d %H:%M:%S") -> str:
         local = self.get_local_time(utc_time)
         return f"{local.strftime(fmt)} (UTC{self.timezone_offset:+d})"
     
-    def is_night_time(self) -> bool:
+    def is_night_time(self, local_time: Optional[datetime] = None) -> bool:
+        """local_time: 调用方已取得的用户本地时间，避免重复读时钟"""
         if not self.alert_mode.night.enabled:
             return False
-        local_time = self.get_local_time()
+        if local_time is None:
+            local_time = self.get_local_time()
         now = local_time.time()
         try:
-            start = datetime.strptime(self.alert_mode.night.night_start, "%H:%M").time()
-            end = datetime.strptime(self.alert_mode.night.night_end, "%H:%M").time()
+            start = _parse_hhmm(self.alert_mode.night.night_start)
+            end = _parse_hhmm(self.alert_mode.night.night_end)
         except:
             return False
         if start <= end:
@@ -278,15 +307,25 @@ class UserConfig:
         else:
             return now >= start or now <= end
     
-    def get_effective_mode(self) -> AlertMode:
+    def get_effective_mode(self, is_night: Optional[bool] = None) -> AlertMode:
         night_config = self.alert_mode.night
-        if night_config.enabled and night_config.auto_switch and self.is_night_time():
+        if is_night is None:
+            is_night = self.is_night_time()
+        if night_config.enabled and night_config.auto_switch and is_night:
             return AlertMode.REPEAT
         return self.alert_mode.mode
     
-    def get_repeat_config(self) -> dict:
-        """获取当前生效的重复配置"""
-        if self.is_night_time() and self.alert_mode.night.enabled:
+    def time_snapshot(self) -> Tuple[datetime, bool, AlertMode]:
+        """一次读时钟得到 (本地时间, 是否夜间, 生效模式)，供菜单渲染共用"""
+        local_now = self.get_local_time()
+        is_night = self.is_night_time(local_now)
+        return local_now, is_night, self.get_effective_mode(is_night)
+    
+    def get_repeat_config(self, is_night: Optional[bool] = None) -> dict:
+        """获取当前生效的重复配置（可传入已计算的 is_night 避免重复计算）"""
+        if is_night is None:
+            is_night = self.is_night_time()
+        if is_night and self.alert_mode.night.enabled:
             return {
                 'enabled': True,
                 'interval_seconds': self.alert_mode.night.night_interval_seconds,
@@ -302,12 +341,14 @@ class UserConfig:
                 'require_confirm': repeat.require_confirm,
             }
     
-    def get_notify_channels(self) -> List[NotifyChannel]:
+    def get_notify_channels(self, is_night: Optional[bool] = None) -> List[NotifyChannel]:
         channels = list(self.notify_channels)
         night_config = self.alert_mode.night
+        if is_night is None:
+            is_night = self.is_night_time()
         if (night_config.enabled and 
             night_config.night_add_email and 
-            self.is_night_time() and
+            is_night and
             self.email.enabled and
             NotifyChannel.EMAIL not in channels):
             channels.append(NotifyChannel.EMAIL)
@@ -399,39 +440,154 @@ PRESET_CONFIGS = {
 
 
 class UserManager:
-    """多用户管理器"""
+    """多用户管理器 (SQLite 存储，每个用户一行)"""
     
     def __init__(self, data_dir: str = "data"):
         self.data_dir = data_dir
+        self.db_file = os.path.join(data_dir, "users.db")
+        # 旧版 JSON 存储，仅用于首次迁移
         self.users_file = os.path.join(data_dir, "users.json")
         self.users: Dict[str, UserConfig] = {}
         self.admin_ids: Set[str] = set()
+        # 活跃用户数，增量维护
+        self._active_count = 0
+        
+        # 后台写盘状态: 待写入的用户ID
+        self._dirty: Set[str] = set()
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._write_lock = asyncio.Lock()
+        self._flush_tasks: Set[asyncio.Task] = set()
         
         os.makedirs(data_dir, exist_ok=True)
+        self._db = self._open_db()
         self._load()
         
         admin_env = os.getenv('ADMIN_USER_IDS', '')
         if admin_env:
             self.admin_ids = set(admin_env.split(','))
     
+    def _open_db(self) -> sqlite3.Connection:
+        # 写入在后台线程执行 (由 _write_lock 串行化)，允许跨线程使用连接
+        db = sqlite3.connect(self.db_file, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id TEXT PRIMARY KEY, "
+            "chat_id TEXT NOT NULL DEFAULT '', "
+            "is_active INTEGER NOT NULL DEFAULT 1, "
+            "data TEXT NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_users_active ON users (is_active)")
+        db.commit()
+        return db
+    
     def _load(self):
-        if os.path.exists(self.users_file):
-            try:
-                with open(self.users_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for user_id, user_data in data.items():
-                        self.users[user_id] = self._dict_to_config(user_data)
-                logger.info(f"已加载 {len(self.users)} 个用户配置")
-            except Exception as e:
-                logger.error(f"加载用户数据失败: {e}")
-    
-    def _save(self):
         try:
-            data = {uid: self._config_to_dict(cfg) for uid, cfg in self.users.items()}
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            for user_id, data in self._db.execute("SELECT user_id, data FROM users"):
+                self.users[user_id] = self._dict_to_config(json.loads(data))
         except Exception as e:
-            logger.error(f"保存用户数据失败: {e}")
+            logger.error(f"加载用户数据失败: {e}")
+        
+        if not self.users:
+            self._migrate_json()
+        
+        self._active_count = sum(1 for u in self.users.values() if u.is_active)
+        logger.info(f"已加载 {len(self.users)} 个用户配置")
+    
+    def _migrate_json(self):
+        """数据库为空时导入旧版 users.json (原文件保留)"""
+        if not os.path.exists(self.users_file) or os.path.getsize(self.users_file) == 0:
+            return
+        try:
+            with open(self.users_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for user_id, user_data in data.items():
+                self.users[user_id] = self._dict_to_config(user_data)
+        except Exception as e:
+            logger.error(f"迁移用户数据失败: {e}")
+            return
+        try:
+            self._write(self._snapshot(self.users.keys()))
+            logger.info(f"已从 users.json 迁移 {len(self.users)} 个用户")
+        except Exception:
+            # 数据已在内存中，标记为待写入，下一次 flush 时补写
+            self._dirty.update(self.users)
+            logger.exception("迁移用户数据写入失败，稍后重试")
+    
+    def _save(self, user_id: str):
+        """
+        标记用户数据已修改。事件循环中合并 SAVE_DEBOUNCE 内的修改，
+        由后台线程一次写入；没有事件循环时直接写入
+        """
+        self._dirty.add(str(user_id))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            dirty, self._dirty = self._dirty, set()
+            try:
+                self._write(self._snapshot(dirty))
+            except Exception:
+                # 放回待写集合，下次保存时一并重试
+                self._dirty |= dirty
+                logger.exception("保存用户数据失败")
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(SAVE_DEBOUNCE, self._start_flush)
+    
+    def mark_dirty(self, user_id: str):
+        """外部直接修改 UserConfig 字段后调用，合并到下一次后台写入"""
+        self._save(user_id)
+    
+    def _start_flush(self):
+        self._save_handle = None
+        task = asyncio.ensure_future(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def flush(self):
+        """立即写入未保存的修改 (需要落盘后再回复时使用)"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            # 在事件循环线程中序列化，线程里只执行 SQL
+            rows = self._snapshot(dirty)
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception:
+                # 写入失败的用户放回待写集合 (重试时重新取快照)，稍后自动重试
+                self._dirty |= dirty
+                logger.exception(f"保存用户数据失败，{SAVE_RETRY_DELAY} 秒后重试")
+                if self._save_handle is None:
+                    loop = asyncio.get_running_loop()
+                    self._save_handle = loop.call_later(SAVE_RETRY_DELAY, self._start_flush)
+    
+    def _snapshot(self, user_ids) -> List[Tuple[str, str, int, str]]:
+        rows = []
+        for uid in user_ids:
+            cfg = self.users.get(uid)
+            if cfg is not None:
+                rows.append((
+                    uid, cfg.chat_id, int(cfg.is_active),
+                    json.dumps(self._config_to_dict(cfg), ensure_ascii=False),
+                ))
+        return rows
+    
+    def _write(self, rows: List[Tuple[str, str, int, str]]):
+        """一个事务内 upsert，失败时回滚并抛出，由调用方决定重试"""
+        if not rows:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO users (user_id, chat_id, is_active, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET "
+                "chat_id = excluded.chat_id, is_active = excluded.is_active, data = excluded.data",
+                rows
+            )
     
     def _dict_to_config(self, data: dict) -> UserConfig:
         config = UserConfig()
@@ -556,7 +712,8 @@ class UserManager:
     def get_or_create_user(self, user_id: str, username: str = "", 
                            chat_id: str = "") -> UserConfig:
         user_id = str(user_id)
-        if user_id not in self.users:
+        config = self.users.get(user_id)
+        if config is None:
             config = UserConfig(
                 user_id=user_id,
                 username=username,
@@ -566,22 +723,39 @@ class UserManager:
                 created_at=datetime.now().isoformat(),
             )
             self.users[user_id] = config
-            self._save()
+            self._active_count += 1
+            self._save(user_id)
             logger.info(f"新用户注册: {user_id} ({username})")
-        else:
-            if username:
-                self.users[user_id].username = username
-            if chat_id:
-                self.users[user_id].chat_id = chat_id
-        return self.users[user_id]
+            return config
+        
+        # 用户名 / chat_id 有变化时更新并保存
+        changed = False
+        if username and config.username != username:
+            config.username = username
+            changed = True
+        if chat_id and config.chat_id != chat_id:
+            config.chat_id = chat_id
+            changed = True
+        if changed:
+            self._save(user_id)
+        return config
     
-    def update_user(self, user_id: str, **kwargs):
-        user_id = str(user_id)
-        if user_id in self.users:
+    def update_user(self, user_id: str, **kwargs) -> Optional[UserConfig]:
+        """更新用户字段，返回更新后的配置 (用户不存在时返回 None)"""
+        user = self.users.get(str(user_id))
+        if user:
+            was_active = user.is_active
+            changed = False
             for key, value in kwargs.items():
-                if hasattr(self.users[user_id], key):
-                    setattr(self.users[user_id], key, value)
-            self._save()
+                if hasattr(user, key) and getattr(user, key) != value:
+                    setattr(user, key, value)
+                    changed = True
+            if user.is_active != was_active:
+                self._active_count += 1 if user.is_active else -1
+            # 值没有变化时不写盘
+            if changed:
+                self._save(user_id)
+        return user
     
     def set_profile(self, user_id: str, profile: AlertProfile):
         user_id = str(user_id)
@@ -595,40 +769,53 @@ class UserManager:
                 config.volume = preset['volume']
                 config.big_order = preset['big_order']
                 config.cooldown_seconds = preset['cooldown_seconds']
-            self._save()
+            self._save(user_id)
     
     def set_alert_mode(self, user_id: str, mode: AlertMode):
         user_id = str(user_id)
-        if user_id in self.users:
-            self.users[user_id].alert_mode.mode = mode
+        user = self.users.get(user_id)
+        if user:
+            alert_mode = user.alert_mode
+            if alert_mode.mode == mode and (mode != AlertMode.REPEAT or alert_mode.repeat.enabled):
+                return
+            alert_mode.mode = mode
             if mode == AlertMode.REPEAT:
-                self.users[user_id].alert_mode.repeat.enabled = True
-            self._save()
+                alert_mode.repeat.enabled = True
+            self._save(user_id)
     
-    def set_night_mode(self, user_id: str, enabled: bool):
-        user_id = str(user_id)
-        if user_id in self.users:
-            self.users[user_id].alert_mode.night.enabled = enabled
-            self._save()
+    def set_night_mode(self, user_id: str, enabled: bool) -> Optional[UserConfig]:
+        user = self.users.get(str(user_id))
+        if user and user.alert_mode.night.enabled != enabled:
+            user.alert_mode.night.enabled = enabled
+            self._save(user_id)
+        return user
     
     def set_night_time(self, user_id: str, start: str, end: str):
         user_id = str(user_id)
-        if user_id in self.users:
-            self.users[user_id].alert_mode.night.night_start = start
-            self.users[user_id].alert_mode.night.night_end = end
-            self._save()
+        user = self.users.get(user_id)
+        if user:
+            night = user.alert_mode.night
+            if night.night_start == start and night.night_end == end:
+                return
+            night.night_start = start
+            night.night_end = end
+            self._save(user_id)
     
     def enable_email(self, user_id: str, email_address: str = None) -> bool:
         user_id = str(user_id)
         if user_id not in self.users:
             return False
         config = self.users[user_id]
+        changed = not config.email.enabled
         config.email.enabled = True
         if email_address and email_address not in config.email.to_addresses:
             config.email.to_addresses.append(email_address)
+            changed = True
         if NotifyChannel.EMAIL not in config.notify_channels:
             config.notify_channels.append(NotifyChannel.EMAIL)
-        self._save()
+            changed = True
+        if changed:
+            self._save(user_id)
         return True
     
     def disable_email(self, user_id: str) -> bool:
@@ -636,60 +823,85 @@ class UserManager:
         if user_id not in self.users:
             return False
         config = self.users[user_id]
+        changed = config.email.enabled
         config.email.enabled = False
         if NotifyChannel.EMAIL in config.notify_channels:
             config.notify_channels.remove(NotifyChannel.EMAIL)
-        self._save()
+            changed = True
+        if changed:
+            self._save(user_id)
         return True
     
-    def set_timezone(self, user_id: str, offset: int, name: str = ""):
-        user_id = str(user_id)
-        if user_id in self.users:
-            self.users[user_id].timezone_offset = offset
-            self.users[user_id].timezone_name = name or f"UTC{offset:+d}"
-            self._save()
+    def set_timezone(self, user_id: str, offset: int, name: str = "") -> Optional[UserConfig]:
+        user = self.users.get(str(user_id))
+        if user:
+            name = name or f"UTC{offset:+d}"
+            if user.timezone_offset != offset or user.timezone_name != name:
+                user.timezone_offset = offset
+                user.timezone_name = name
+                self._save(user_id)
+        return user
     
     def add_to_whitelist(self, user_id: str, symbols: List[str]):
         user_id = str(user_id)
-        if user_id in self.users:
+        user = self.users.get(user_id)
+        if user:
+            # 用集合判重，一次保存
+            current = user.whitelist
+            seen = set(current)
+            before = len(current)
             for symbol in symbols:
                 symbol = symbol.upper().strip()
-                if symbol and symbol not in self.users[user_id].whitelist:
-                    self.users[user_id].whitelist.append(symbol)
-            self._save()
+                if symbol and symbol not in seen:
+                    seen.add(symbol)
+                    current.append(symbol)
+            if len(current) != before:
+                self._save(user_id)
     
     def remove_from_whitelist(self, user_id: str, symbols: List[str]):
         user_id = str(user_id)
-        if user_id in self.users:
-            for symbol in symbols:
-                symbol = symbol.upper().strip()
-                if symbol in self.users[user_id].whitelist:
-                    self.users[user_id].whitelist.remove(symbol)
-            self._save()
+        user = self.users.get(user_id)
+        if user:
+            # 一次过滤重建列表，代替逐个 list.remove
+            drop = {symbol.upper().strip() for symbol in symbols}
+            kept = [s for s in user.whitelist if s not in drop]
+            if len(kept) != len(user.whitelist):
+                user.whitelist = kept
+                self._save(user_id)
     
     def add_to_blacklist(self, user_id: str, symbols: List[str]):
         user_id = str(user_id)
-        if user_id in self.users:
+        user = self.users.get(user_id)
+        if user:
+            # 用集合判重，一次保存
+            current = user.blacklist
+            seen = set(current)
+            before = len(current)
             for symbol in symbols:
                 symbol = symbol.upper().strip()
-                if symbol and symbol not in self.users[user_id].blacklist:
-                    self.users[user_id].blacklist.append(symbol)
-            self._save()
+                if symbol and symbol not in seen:
+                    seen.add(symbol)
+                    current.append(symbol)
+            if len(current) != before:
+                self._save(user_id)
     
     def remove_from_blacklist(self, user_id: str, symbols: List[str]):
         user_id = str(user_id)
-        if user_id in self.users:
-            for symbol in symbols:
-                symbol = symbol.upper().strip()
-                if symbol in self.users[user_id].blacklist:
-                    self.users[user_id].blacklist.remove(symbol)
-            self._save()
+        user = self.users.get(user_id)
+        if user:
+            # 一次过滤重建列表，代替逐个 list.remove
+            drop = {symbol.upper().strip() for symbol in symbols}
+            kept = [s for s in user.blacklist if s not in drop]
+            if len(kept) != len(user.blacklist):
+                user.blacklist = kept
+                self._save(user_id)
     
     def set_watch_mode(self, user_id: str, mode: str):
         user_id = str(user_id)
-        if user_id in self.users and mode in ['all', 'whitelist', 'blacklist']:
-            self.users[user_id].watch_mode = mode
-            self._save()
+        user = self.users.get(user_id)
+        if user and mode in ['all', 'whitelist', 'blacklist'] and user.watch_mode != mode:
+            user.watch_mode = mode
+            self._save(user_id)
     
     def get_active_users(self) -> List[UserConfig]:
         return [u for u in self.users.values() if u.is_active]
@@ -703,13 +915,31 @@ class UserManager:
     def get_all_users(self) -> List[UserConfig]:
         return list(self.users.values())
     
-    def set_volume_filter(self, user_id: str, enabled: bool, min_volume: float = 0):
-        user_id = str(user_id)
-        if user_id in self.users:
-            self.users[user_id].volume_filter_enabled = enabled
+    def count(self) -> int:
+        return len(self.users)
+    
+    def count_active(self) -> int:
+        return self._active_count
+    
+    def get_user_counts(self) -> Tuple[int, int]:
+        """返回 (总用户数, 活跃用户数)，不遍历用户"""
+        return len(self.users), self._active_count
+    
+    def list_users(self, limit: int = 20, offset: int = 0) -> List[UserConfig]:
+        """按注册顺序分页取用户，不复制整个用户表"""
+        return list(islice(self.users.values(), offset, offset + limit))
+    
+    def set_volume_filter(self, user_id: str, enabled: bool, 
+                          min_volume: float = 0) -> Optional[UserConfig]:
+        user = self.users.get(str(user_id))
+        if user:
+            if user.volume_filter_enabled == enabled and (min_volume <= 0 or user.min_volume_24h == min_volume):
+                return user
+            user.volume_filter_enabled = enabled
             if min_volume > 0:
-                self.users[user_id].min_volume_24h = min_volume
-            self._save()
+                user.min_volume_24h = min_volume
+            self._save(user_id)
+        return user
 
 
 # 全局用户管理器
@@ -22,7 +22,7 @@ from alert_engine import AlertEngine
 from notifier import MultiUserNotifier
 from telegram_bot import TelegramBot
 from models import Alert
-from config import UserConfig
+from config import UserConfig, user_manager
 
 
 class CoinWhistleSystem:
@@ -96,6 +96,7 @@ class CoinWhistleSystem:
             await self.binance.stop()
             await self.bot.stop()
             await self.notifier.stop()
+            await user_manager.flush()
             logger.info("✅ 系统已停止")
         except Exception as e:
             logger.error(f"停止时出错: {e}")
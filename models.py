@@ -6,9 +6,19 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, List
 from enum import Enum
 from collections import deque
+import html
+import re
 import uuid
 
 
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def strip_html(text: str) -> str:
+    """去掉HTML标签并还原实体，用于纯文本发送"""
+    return html.unescape(_HTML_TAG_RE.sub("", text))
+
+
 class MarketType(Enum):
     SPOT = "spot"
     FUTURES = "futures"
@@ -144,6 +154,8 @@ class Alert:
     sent_count: int = 0
     last_sent: Optional[datetime] = None
     confirmed_at: Optional[datetime] = None
+    # HTML解析失败过的报警，后续重复直接用纯文本发送
+    plain_text_only: bool = False
     
     def to_telegram_message(self, prefix: str = "", tz_offset: int = 8) -> str:
         """生成Telegram消息 - 优化格式"""
@@ -240,6 +252,10 @@ class Alert:
         
         return '\n'.join(lines)
     
+    def to_plain_message(self, prefix: str = "", tz_offset: int = 8) -> str:
+        """生成纯文本Telegram消息（HTML解析失败时的降级）"""
+        return strip_html(self.to_telegram_message(prefix, tz_offset))
+    
     def _make_position_bar(self, position: float) -> str:
         """生成位置条 - 显示当前价格在24h范围内的位置"""
         total_blocks = 10
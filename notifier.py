@@ -3,8 +3,10 @@
 """
 import asyncio
 import os
+import zlib
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 from loguru import logger
 
 try:
@@ -16,15 +18,45 @@ except ImportError:
     HAS_SMTP = False
     logger.warning("aiosmtplib 未安装")
 
+try:
+    from pyroaring import BitMap
+    HAS_ROARING = True
+except ImportError:
+    HAS_ROARING = False
+
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.error import Forbidden, BadRequest, TelegramError, TimedOut, NetworkError
 from telegram.request import HTTPXRequest
 
-from models import Alert, AlertStatus
+from models import Alert, AlertStatus, strip_html
 from config import user_manager, AlertMode, NotifyChannel, UserConfig
 
 
+# 发送队列上限，超过后丢弃新的非报警消息
+SEND_QUEUE_MAXSIZE = 5000
+# 队列占用超过该比例视为背压状态
+SEND_QUEUE_BACKPRESSURE_RATIO = 0.8
+# 广播分批入队，占用超过该值时等待队列消化，不挤占其他消息
+BROADCAST_QUEUE_LIMIT = SEND_QUEUE_MAXSIZE // 4
+
+# 每个用户最多保留的待确认报警数，超出后淘汰最早的
+MAX_PENDING_PER_USER = 500
+
+def _aid_to_u32(alert_id: str) -> int:
+    """报警ID转为uint32（默认ID为8位十六进制，可无损转换；其他ID用crc32）"""
+    if len(alert_id) == 8:
+        try:
+            return int(alert_id, 16)
+        except ValueError:
+            pass
+    return zlib.crc32(alert_id.encode())
+
+
+# 夜间模式重复提示（按 repeat_config 字段填充）
+_NIGHT_SUFFIX = "\n\n🌙 <i>夜间模式: 每{interval_seconds}秒重复，最多{max_repeats}次</i>"
+
+
 class MultiUserNotifier:
     """多用户通知管理器"""
     
@@ -32,18 +64,22 @@ class MultiUserNotifier:
         self.telegram_token = telegram_token
         self._bot: Optional[Bot] = None
         
-        # 待确认报警: {user_id: {alert_id: Alert}}
-        self.pending_alerts: Dict[str, Dict[str, Alert]] = {}
-        # 已确认ID: {user_id: set(alert_ids)}
-        self.confirmed_ids: Dict[str, Set[str]] = {}
+        # 待确认报警: {user_id: OrderedDict(alert_id -> Alert)}，按加入顺序
+        self.pending_alerts: Dict[str, "OrderedDict[str, Alert]"] = {}
+        # 已确认ID: {user_id: BitMap(uint32 ids)}，未安装 pyroaring 时退回 set(alert_ids)
+        self.confirmed_ids: Dict[str, Set] = {}
+        # 有待处理报警的用户，重复循环只扫描这些用户
+        self._dirty_users: Set[str] = set()
         
         self._running = False
         self._repeat_task = None
         
-        # 发送队列和速率限制
-        self._send_queue: asyncio.Queue = asyncio.Queue()
+        # 发送队列和速率限制（有界队列，Telegram故障时不会无限堆积）
+        self._send_queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_MAXSIZE)
         self._send_task = None
         self._rate_limit_delay = 0.05  # 50ms between messages (20 msg/sec)
+        self._queue_high_water = 0
+        self._queue_dropped = 0
         
         # SMTP配置
         self.smtp_host = os.getenv('SMTP_HOST', '')
@@ -146,67 +182,114 @@ class MultiUserNotifier:
                 logger.error(f"发送队列处理错误: {e}")
                 await asyncio.sleep(0.1)
     
-    async def _queue_send(self, func, *args, **kwargs):
-        """将发送任务加入队列"""
-        await self._send_queue.put((func, args, kwargs))
+    def _queue_send(self, func, *args, **kwargs) -> bool:
+        """将发送任务加入队列，队列已满时丢弃（报警不走队列），返回是否入队"""
+        try:
+            self._send_queue.put_nowait((func, args, kwargs))
+        except asyncio.QueueFull:
+            self._queue_dropped += 1
+            logger.warning(f"发送队列已满，丢弃消息 (累计丢弃 {self._queue_dropped})")
+            return False
+        
+        self._track_high_water()
+        return True
+    
+    def _track_high_water(self):
+        size = self._send_queue.qsize()
+        if size > self._queue_high_water:
+            self._queue_high_water = size
+    
+    @property
+    def is_backpressured(self) -> bool:
+        """发送队列接近上限，调用方可据此跳过低价值通知"""
+        return self._send_queue.qsize() >= SEND_QUEUE_MAXSIZE * SEND_QUEUE_BACKPRESSURE_RATIO
     
     async def send_alert_to_user(self, alert: Alert, user_config: UserConfig):
         """发送报警给用户"""
         user_id = user_config.user_id
         alert.target_user_id = user_id
         
-        effective_mode = user_config.get_effective_mode()
         is_night = user_config.is_night_time()
+        effective_mode = user_config.get_effective_mode(is_night)
         night_prefix = "🌙 " if is_night else ""
         need_confirm = (effective_mode == AlertMode.REPEAT)
         
         if need_confirm:
             success = await self._send_once(alert, user_config, prefix=night_prefix, 
-                                  show_confirm_button=True, show_mute_button=True)
+                                  show_confirm_button=True, show_mute_button=True,
+                                  is_night=is_night)
             
             if success:
-                if user_id not in self.pending_alerts:
-                    self.pending_alerts[user_id] = {}
-                self.pending_alerts[user_id][alert.id] = alert
+                pending = self.pending_alerts.get(user_id)
+                if pending is None:
+                    pending = self.pending_alerts[user_id] = OrderedDict()
+                pending[alert.id] = alert
+                self._dirty_users.add(user_id)
                 logger.info(f"报警已加入重复队列: {alert.id}")
+                
+                while len(pending) > MAX_PENDING_PER_USER:
+                    oldest_id, _ = pending.popitem(last=False)
+                    logger.warning(f"待确认报警超过上限 {MAX_PENDING_PER_USER}，淘汰最早的: {oldest_id} (user={user_id})")
         else:
             await self._send_once(alert, user_config, prefix=night_prefix,
-                                  show_confirm_button=False, show_mute_button=True)
+                                  show_confirm_button=False, show_mute_button=True,
+                                  is_night=is_night)
     
     async def _send_once(self, alert: Alert, user_config: UserConfig, 
                          prefix: str = "", show_confirm_button: bool = False,
-                         show_mute_button: bool = True) -> bool:
+                         show_mute_button: bool = True,
+                         is_night: Optional[bool] = None) -> bool:
         """发送一次报警，返回是否成功"""
         alert.sent_count += 1
         alert.last_sent = datetime.now()
         alert.status = AlertStatus.SENT
         
-        channels = user_config.get_notify_channels()
-        success = True
-        
-        # Telegram
-        if NotifyChannel.TELEGRAM in channels or NotifyChannel.ALL in channels:
-            tg_success = await self._send_telegram(alert, user_config, prefix, 
-                                      show_confirm_button, show_mute_button)
-            if not tg_success:
-                success = False
+        if is_night is None:
+            is_night = user_config.is_night_time()
         
-        # Email
-        should_send_email = (
-            NotifyChannel.EMAIL in channels or 
-            NotifyChannel.ALL in channels
+        channels = user_config.get_notify_channels(is_night)
+        send_all = NotifyChannel.ALL in channels
+        send_telegram = send_all or NotifyChannel.TELEGRAM in channels
+        send_email = (
+            (send_all or NotifyChannel.EMAIL in channels) and
+            user_config.email.to_addresses
         )
-        if should_send_email and user_config.email.to_addresses:
-            await self._send_email(alert, user_config, prefix)
         
-        return success
+        # Telegram 与邮件并发发送，邮件较慢不阻塞 Telegram
+        coros = []
+        if send_telegram:
+            coros.append(self._send_telegram(alert, user_config, prefix, 
+                                             show_confirm_button, show_mute_button,
+                                             is_night=is_night))
+        if send_email:
+            coros.append(self._send_email(alert, user_config, prefix))
+        
+        if not coros:
+            return True
+        
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        
+        if not send_telegram:
+            return True
+        
+        # 以 Telegram 的结果作为成功标志
+        tg_result = results[0]
+        if isinstance(tg_result, BaseException):
+            logger.error(f"Telegram发送失败: {tg_result}")
+            return False
+        return tg_result
     
     async def _send_telegram(self, alert: Alert, user_config: UserConfig, 
                              prefix: str = "", show_confirm_button: bool = False,
-                             show_mute_button: bool = True) -> bool:
+                             show_mute_button: bool = True,
+                             is_night: Optional[bool] = None) -> bool:
         """发送Telegram消息，返回是否成功"""
+        plain = alert.plain_text_only
         try:
-            message = alert.to_telegram_message(prefix, user_config.timezone_offset)
+            if plain:
+                message = alert.to_plain_message(prefix, user_config.timezone_offset)
+            else:
+                message = alert.to_telegram_message(prefix, user_config.timezone_offset)
             
             symbol = alert.symbol
             name = symbol.replace('USDT', '')
@@ -214,8 +297,9 @@ class MultiUserNotifier:
             buttons = []
             
             if show_confirm_button:
-                is_night = user_config.is_night_time()
-                repeat_config = user_config.get_repeat_config()
+                if is_night is None:
+                    is_night = user_config.is_night_time()
+                repeat_config = user_config.get_repeat_config(is_night)
                 
                 buttons.append([
                     InlineKeyboardButton(
@@ -225,7 +309,8 @@ class MultiUserNotifier:
                 ])
                 
                 if is_night:
-                    message += f"\n\n🌙 <i>夜间模式: 每{repeat_config['interval_seconds']}秒重复，最多{repeat_config['max_repeats']}次</i>"
+                    suffix = _NIGHT_SUFFIX.format_map(repeat_config)
+                    message = "".join((message, strip_html(suffix) if plain else suffix))
             
             if show_mute_button:
                 buttons.append([
@@ -252,7 +337,7 @@ class MultiUserNotifier:
             await self._bot.send_message(
                 chat_id=user_config.chat_id,
                 text=message,
-                parse_mode=ParseMode.HTML,
+                parse_mode=None if plain else ParseMode.HTML,
                 disable_web_page_preview=True,
                 reply_markup=keyboard,
                 read_timeout=30,
@@ -272,14 +357,23 @@ class MultiUserNotifier:
             # 超时可能成功，返回True避免重复发送
             return True
             
-        except NetworkError as e:
-            logger.error(f"Telegram网络错误 ({user_config.user_id}): {e}")
-            return False
-            
+        # BadRequest 是 NetworkError 的子类，必须先捕获
         except BadRequest as e:
+            error_msg = str(e).lower()
+            if not plain and ("parse" in error_msg or "entities" in error_msg):
+                # HTML解析失败：改用纯文本重试一次，之后的重复也直接走纯文本
+                logger.warning(f"Telegram HTML解析失败，改用纯文本 ({user_config.user_id}): {e}")
+                alert.plain_text_only = True
+                return await self._send_telegram(alert, user_config, prefix,
+                                                 show_confirm_button, show_mute_button,
+                                                 is_night=is_night)
             logger.error(f"Telegram BadRequest ({user_config.user_id}): {e}")
             return False
             
+        except NetworkError as e:
+            logger.error(f"Telegram网络错误 ({user_config.user_id}): {e}")
+            return False
+            
         except TelegramError as e:
             logger.error(f"Telegram错误 ({user_config.user_id}): {e}")
             return False
@@ -330,29 +424,40 @@ class MultiUserNotifier:
             try:
                 await asyncio.sleep(5)
                 
-                for user_id, alerts in list(self.pending_alerts.items()):
+                for user_id in self._dirty_users & self.pending_alerts.keys():
+                    alerts = self.pending_alerts[user_id]
+                    if not alerts:
+                        self.pending_alerts.pop(user_id, None)
+                        self._dirty_users.discard(user_id)
+                        continue
+                    
                     user_config = user_manager.get_user(user_id)
                     if not user_config or not user_config.is_active:
                         self.pending_alerts.pop(user_id, None)
+                        self._dirty_users.discard(user_id)
                         continue
                     
-                    repeat_config = user_config.get_repeat_config()
+                    # 每个用户每轮只计算一次夜间状态，后续配置/渠道/消息都复用
+                    is_night = user_config.is_night_time()
+                    repeat_config = user_config.get_repeat_config(is_night)
                     
-                    if not repeat_config['enabled'] and user_config.get_effective_mode() != AlertMode.REPEAT:
+                    if not repeat_config['enabled'] and user_config.get_effective_mode(is_night) != AlertMode.REPEAT:
                         continue
                     
                     now = datetime.now()
                     interval = timedelta(seconds=repeat_config['interval_seconds'])
                     max_repeats = repeat_config['max_repeats']
-                    is_night = user_config.is_night_time()
                     
                     to_remove = []
+                    due_ids = []
                     
-                    for alert_id, alert in list(alerts.items()):
+                    # 先只遍历key分类（不await，不会有并发修改），再逐个发送
+                    for alert_id in alerts:
                         if self._is_confirmed(user_id, alert_id):
                             to_remove.append(alert_id)
                             continue
                         
+                        alert = alerts[alert_id]
                         if not user_config.should_monitor(alert.symbol):
                             to_remove.append(alert_id)
                             logger.info(f"代币已被静音，停止重复: {alert.symbol}")
@@ -363,21 +468,32 @@ class MultiUserNotifier:
                             continue
                         
                         if alert.last_sent and now - alert.last_sent >= interval:
-                            night_prefix = "🌙 " if is_night else ""
-                            prefix = f"{night_prefix}🔔 重复 [{alert.sent_count + 1}/{max_repeats}] "
-                            
-                            success = await self._send_once(
-                                alert, 
-                                user_config, 
-                                prefix,
-                                show_confirm_button=True
-                            )
-                            
-                            if not success:
-                                to_remove.append(alert_id)
+                            due_ids.append(alert_id)
                     
                     for aid in to_remove:
                         alerts.pop(aid, None)
+                    
+                    for alert_id in due_ids:
+                        alert = alerts.get(alert_id)
+                        if alert is None:
+                            continue
+                        
+                        night_prefix = "🌙 " if is_night else ""
+                        prefix = f"{night_prefix}🔔 重复 [{alert.sent_count + 1}/{max_repeats}] "
+                        
+                        success = await self._send_once(
+                            alert, 
+                            user_config, 
+                            prefix,
+                            show_confirm_button=True,
+                            is_night=is_night,
+                        )
+                        
+                        if not success:
+                            alerts.pop(alert_id, None)
+                    
+                    if not alerts:
+                        self._dirty_users.discard(user_id)
                         
             except asyncio.CancelledError:
                 break
@@ -385,18 +501,24 @@ class MultiUserNotifier:
                 logger.error(f"重复报警错误: {e}")
     
     def _is_confirmed(self, user_id: str, alert_id: str) -> bool:
-        return user_id in self.confirmed_ids and alert_id in self.confirmed_ids[user_id]
+        confirmed = self.confirmed_ids.get(user_id)
+        if confirmed is None:
+            return False
+        return (_aid_to_u32(alert_id) if HAS_ROARING else alert_id) in confirmed
+    
+    def _mark_confirmed(self, user_id: str, alert_id: str):
+        confirmed = self.confirmed_ids.get(user_id)
+        if confirmed is None:
+            confirmed = self.confirmed_ids[user_id] = BitMap() if HAS_ROARING else set()
+        confirmed.add(_aid_to_u32(alert_id) if HAS_ROARING else alert_id)
     
     def confirm_alert(self, user_id: str, alert_id: str) -> bool:
         """确认报警"""
         user_id = str(user_id)
         
-        if user_id not in self.confirmed_ids:
-            self.confirmed_ids[user_id] = set()
-        
         if user_id in self.pending_alerts:
             if alert_id in self.pending_alerts[user_id]:
-                self.confirmed_ids[user_id].add(alert_id)
+                self._mark_confirmed(user_id, alert_id)
                 alert = self.pending_alerts[user_id].pop(alert_id)
                 alert.status = AlertStatus.CONFIRMED
                 alert.confirmed_at = datetime.now()
@@ -405,14 +527,14 @@ class MultiUserNotifier:
             
             for aid in list(self.pending_alerts[user_id].keys()):
                 if aid.startswith(alert_id) or alert_id in aid:
-                    self.confirmed_ids[user_id].add(aid)
+                    self._mark_confirmed(user_id, aid)
                     alert = self.pending_alerts[user_id].pop(aid)
                     alert.status = AlertStatus.CONFIRMED
                     alert.confirmed_at = datetime.now()
                     logger.info(f"报警已确认(模糊): {aid} by {user_id}")
                     return True
         
-        self.confirmed_ids[user_id].add(alert_id)
+        self._mark_confirmed(user_id, alert_id)
         return True
     
     def confirm_all_alerts(self, user_id: str) -> int:
@@ -421,11 +543,8 @@ class MultiUserNotifier:
         count = 0
         
         if user_id in self.pending_alerts:
-            if user_id not in self.confirmed_ids:
-                self.confirmed_ids[user_id] = set()
-            
             for alert_id in list(self.pending_alerts[user_id].keys()):
-                self.confirmed_ids[user_id].add(alert_id)
+                self._mark_confirmed(user_id, alert_id)
                 count += 1
             
             self.pending_alerts[user_id].clear()
@@ -434,30 +553,30 @@ class MultiUserNotifier:
     
     def remove_alerts_for_symbol(self, user_id: str, symbol: str) -> int:
         """移除指定代币的所有待处理报警"""
+        return self.remove_alerts_for_symbols(user_id, [symbol])
+    
+    def remove_alerts_for_symbols(self, user_id: str, symbols: List[str]) -> int:
+        """批量移除多个代币的待处理报警，只遍历一次待处理字典"""
         user_id = str(user_id)
-        symbol = symbol.upper()
-        count = 0
+        alerts = self.pending_alerts.get(user_id)
+        if not alerts:
+            return 0
         
-        if user_id in self.pending_alerts:
-            to_remove = []
-            for alert_id, alert in self.pending_alerts[user_id].items():
-                alert_symbol = alert.symbol.upper()
-                if (alert_symbol == symbol or 
-                    alert_symbol == f"{symbol}USDT" or 
-                    alert_symbol.replace('USDT', '') == symbol.replace('USDT', '')):
-                    to_remove.append(alert_id)
-            
-            for alert_id in to_remove:
-                self.pending_alerts[user_id].pop(alert_id, None)
-                if user_id not in self.confirmed_ids:
-                    self.confirmed_ids[user_id] = set()
-                self.confirmed_ids[user_id].add(alert_id)
-                count += 1
-            
-            if count > 0:
-                logger.info(f"已移除 {symbol} 的 {count} 个待处理报警 (user={user_id})")
+        # 按基础币种比较 (BTC / BTCUSDT 视为同一代币)
+        bases = {s.upper().replace('USDT', '') for s in symbols}
+        to_remove = [
+            alert_id for alert_id, alert in alerts.items()
+            if alert.symbol.upper().replace('USDT', '') in bases
+        ]
         
-        return count
+        for alert_id in to_remove:
+            alerts.pop(alert_id, None)
+            self._mark_confirmed(user_id, alert_id)
+        
+        if to_remove:
+            logger.info(f"已移除 {', '.join(symbols)} 的 {len(to_remove)} 个待处理报警 (user={user_id})")
+        
+        return len(to_remove)
     
     def get_pending_count(self, user_id: str) -> int:
         return len(self.pending_alerts.get(str(user_id), {}))
@@ -495,26 +614,35 @@ class MultiUserNotifier:
             logger.error(f"消息发送失败: {e}")
             return False
     
-    async def broadcast(self, text: str, admin_only: bool = False):
-        """广播消息"""
-        users = user_manager.get_active_users()
-        success_count = 0
-        fail_count = 0
-        
-        for user in users:
-            if admin_only and not user.is_admin:
-                continue
-            
-            result = await self.send_message(user.chat_id, text)
-            if result:
-                success_count += 1
-            else:
-                fail_count += 1
-            
-            # 广播时增加延迟，避免触发限制
-            await asyncio.sleep(0.1)
+    def queue_message(self, chat_id: str, text: str,
+                      reply_markup: InlineKeyboardMarkup = None) -> bool:
+        """低优先级消息走发送队列 (限速，队列满时丢弃)，返回是否入队"""
+        return self._queue_send(self.send_message, chat_id, text, reply_markup)
+    
+    async def broadcast(self, text: str, admin_only: bool = False) -> Tuple[int, int]:
+        """
+        广播消息，逐条入队由发送队列控制速率，返回 (已入队, 未入队)。
+        管理员主动发起的广播不丢弃: 队列占用达到 BROADCAST_QUEUE_LIMIT 时等待消化，
+        始终低于背压阈值，不影响其他通知
+        """
+        recipients = [
+            user.chat_id for user in user_manager.get_active_users()
+            if not admin_only or user.is_admin
+        ]
+        queued_count = 0
+        
+        for chat_id in recipients:
+            while self._running and self._send_queue.qsize() >= BROADCAST_QUEUE_LIMIT:
+                await asyncio.sleep(self._rate_limit_delay * 20)
+            if not self._running:
+                break
+            await self._send_queue.put((self.send_message, (chat_id, text), {}))
+            self._track_high_water()
+            queued_count += 1
         
-        logger.info(f"广播完成: 成功 {success_count}, 失败 {fail_count}")
+        dropped_count = len(recipients) - queued_count
+        logger.info(f"广播已入队: {queued_count}, 未入队 {dropped_count}")
+        return queued_count, dropped_count
     
     def get_queue_size(self) -> int:
         """获取发送队列大小"""
@@ -527,4 +655,6 @@ class MultiUserNotifier:
             'pending_alerts': total_pending,
             'confirmed_users': len(self.confirmed_ids),
             'queue_size': self.get_queue_size(),
+            'queue_high_water': self._queue_high_water,
+            'queue_dropped': self._queue_dropped,
         }
\ No newline at end of file
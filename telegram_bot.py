@@ -2,27 +2,501 @@
 Telegram机器人 - 完整版 (修复静音后重复提醒问题)
 """
 import asyncio
-from typing import Optional, TYPE_CHECKING, Dict
-from datetime import datetime, timedelta
+import functools
+import heapq
+import re
+import sys
+import time
+from bisect import bisect_right
+from itertools import islice
+from typing import Optional, TYPE_CHECKING, Dict, List, Set, Tuple
+from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, Message
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     ContextTypes
 )
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from telegram.error import BadRequest, TelegramError
 from loguru import logger
 
 from config import (
     user_manager, AlertProfile, AlertMode, NotifyChannel,
-    PRESET_CONFIGS, UserConfig, TIMEZONE_PRESETS
+    PRESET_CONFIGS, UserConfig, TIMEZONE_PRESETS, _strip_usdt
 )
 from notifier import MultiUserNotifier
-from models import MarketType
+from models import MarketType, Alert, AlertType, AlertLevel
 
 if TYPE_CHECKING:
     from main import CoinWhistleSystem
 
+# 静音到期通知合并窗口 (秒)
+UNMUTE_BATCH_WINDOW = 2.0
+
+# 排行榜数据缓存时间 (秒)
+RANK_CACHE_TTL = 5.0
+
+# 同一条消息连续重绘的合并窗口 (秒)
+EDIT_COALESCE_DELAY = 0.15
+
+# 整点时区偏移的显示文本
+_TZ_STRS = {offset: f"UTC{offset:+d}" for offset in range(-12, 15)}
+
+# /test 无行情时使用的默认报警数据
+_TEST_ALERT_DATA = {
+    'price': 50000,
+    'change_percent': 5.0,
+    'high_24h': 51000,
+    'low_24h': 49000,
+    'volume_24h': 1000000000,
+}
+
+
+# 交流群按钮 (/start 与 /help 共用)
+_JOIN_GROUP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📢 加入交流群", url="https://t.me/+mMYvl04GeTIwODdl")],
+])
+
+_START_TEMPLATE = (
+    "🦅 <b>欢迎使用币哨监控系统 v1.3</b>\n\n"
+    "你好 <b>{username}</b>！{reactivate_msg}\n\n"
+    "📋 <b>快速开始:</b>\n"
+    "• /menu - 控制面板\n"
+    "• /status - 系统状态\n"
+    "• /test - 测试报警\n"
+    "• /top - 排行榜\n"
+    "• /price BTC - 查询价格\n"
+    "• /night - 夜间模式\n"
+    "• /timezone - 设置时区\n"
+    "• /pending - 待确认报警\n"
+    "• /help - 帮助\n\n"
+    "✨ <b>新功能:</b>\n"
+    "• ⚡ 升级穿透 - 级别升级立即报警\n"
+    "• 🌙 夜间模式 - 自动重复提醒实现紧急唤醒"
+)
+
+_HELP_TEXT = """
+    🦅 <b>币哨监控系统 v1.3 - 帮助</b>
+    
+    <b>📊 排行榜</b>
+    /top - 排行榜菜单
+    /gainers - 涨幅榜
+    /losers - 跌幅榜
+    /volume - 成交额榜
+    /spread - 差价榜
+    /funding - 资金费率
+    /price BTC - 查询价格
+    
+    <b>🔔 报警管理</b>
+    /pending - 待确认报警
+    /confirm - 确认报警列表
+    /confirm all - 确认全部
+    
+    <b>👁️ 监控设置</b>
+    /watch - 监控模式
+    /whitelist add BTC ETH - 白名单
+    /blacklist add SHIB - 黑名单
+    
+    <b>⚙️ 报警设置</b>
+    /profile - 灵敏度
+    /mode - 报警模式
+    /night - 夜间模式 (自动重复提醒)
+    /email xxx@email.com - 邮件
+    
+    <b>🌍 时区</b>
+    /timezone - 时区选择
+    /tz 8 - 直接设置 UTC+8
+    
+    <b>✨ 新功能</b>
+    • ⚡ 升级穿透 - 同级别过滤，升级立即报警
+    • 🌙 夜间模式 - 自动重复提醒实现紧急唤醒
+    """
+
+_STATUS_TEMPLATE = """
+    📊 <b>系统状态</b>
+    
+    <b>运行状态:</b> ✅ 正常
+    <b>现货:</b> {spot_count} 个
+    <b>合约:</b> {futures_count} 个
+    <b>用户:</b> {total_users} 人 (活跃: {active_users})
+    
+    <b>你的配置:</b>
+    • 时区: {timezone_name} (UTC{timezone_offset:+d})
+    • 当前: {day_night}
+    • 生效模式: {effective_mode}
+    • 夜间模式: {night_enabled}
+    • 监控: {watch_mode}
+    • 白名单: {whitelist_count} 个
+    • 黑名单: {blacklist_count} 个
+    • 待确认: {pending} 个
+    
+    ⏰ {local_time}
+    """
+
+_CONFIG_TEMPLATE = """
+⚙️ <b>当前配置</b>
+
+<b>🌍 时区:</b> {timezone_name} (UTC{timezone_offset:+d})
+
+<b>🎯 灵敏度:</b> {profile}
+• 1分钟: ±{pump_1m}%
+• 5分钟: ±{pump_5m}%
+• 冷却: {cooldown}秒
+
+<b>👁️ 监控:</b> {watch_mode}
+• 白名单: {whitelist_count} 个
+• 黑名单: {blacklist_count} 个
+
+<b>🔔 报警模式:</b>
+• 日间模式: {day_mode}
+• 夜间模式: {night_enabled}
+• 当前生效: {effective_mode} {night_icon}
+
+<b>🌙 夜间配置:</b>
+• 时段: {night_start} - {night_end}
+• 间隔: {night_interval}秒
+• 重复: {night_repeats}次
+• 加邮件: {night_email}
+
+<b>📧 通知:</b>
+• 邮件: {email_enabled}
+• 渠道: {channels}
+
+⏰ {local_time}
+"""
+
+# 成交额输入: 数字 + 可选 K/M/B 后缀
+_VOLUME_VALUE_RE = re.compile(r'\s*(\d+(?:\.\d*)?|\.\d+)\s*([KMB]?)\s*', re.IGNORECASE)
+_VOLUME_MULTIPLIERS = {'': 1, 'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+# 静音类回调: mute_symbol_<symbol>[_<minutes>] / extend_mute_<symbol>[_<minutes>] / minvol_<value>
+_MUTE_CB_RE = re.compile(r'(?P<action>mute_symbol|extend_mute)_(?P<sym>.+?)(?:_(?P<mins>\d+))?')
+_MINVOL_CB_RE = re.compile(r'minvol_(?P<value>\d+(?:\.\d*)?)')
+
+
+@functools.lru_cache(maxsize=4096)
+def _norm(symbol: str) -> str:
+    """标准化交易对 (大写 + USDT 后缀)，并驻留字符串以加快字典比较"""
+    s = symbol.upper().strip()
+    return sys.intern(s if s.endswith('USDT') else s + 'USDT')
+
+
+# 时区按钮回调 tz_<offset>_<name> -> (偏移, 名称)，按钮只由 TIMEZONE_PRESETS 生成
+_TZ_CALLBACKS = {f"tz_{offset}_{name}": (offset, name) for name, offset in TIMEZONE_PRESETS.items()}
+
+
+@functools.lru_cache(maxsize=64)
+def _split_setting_cb(data: str) -> Tuple[str, str, int]:
+    """拆分 repeat_/night_ 回调为 (字段, 值, 整数值)，按钮取值固定，缓存解析结果"""
+    _, field, value = data.split("_", 2)
+    # time 字段的值是 "<start>_<end>"，其余字段为整数，非法值照旧抛 ValueError
+    return field, value, 0 if field == "time" else int(value)
+
+
+# 市场显示名称与图标
+_MARKET_META = {
+    MarketType.SPOT: ("现货", "📈"),
+    MarketType.FUTURES: ("合约", "📊"),
+}
+
+
+# 格式化分档: bisect_right(边界, 值) 直接得到档位下标
+_VOL_BOUNDS = (1_000, 1_000_000, 1_000_000_000)
+_VOL_TIERS = ((1, ""), (1_000, "K"), (1_000_000, "M"), (1_000_000_000, "B"))
+_PRICE_BOUNDS = (0.0001, 1, 1000)
+_PRICE_FMTS = (".8f", ".6f", ".4f", ",.2f")
+
+
+# 排行榜刷新时价格/成交额大量重复，缓存格式化结果
+@functools.lru_cache(maxsize=4096)
+def _format_volume(v: float) -> str:
+    """格式化成交额"""
+    div, suffix = _VOL_TIERS[bisect_right(_VOL_BOUNDS, v)]
+    return f"${v/div:.2f}{suffix}"
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_price(p: float) -> str:
+    """格式化价格"""
+    return f"${p:{_PRICE_FMTS[bisect_right(_PRICE_BOUNDS, p)]}}"
+
+
+@functools.lru_cache(maxsize=256)
+def _refresh_markup(callback_data: str) -> InlineKeyboardMarkup:
+    """只有一个刷新按钮的键盘，按 callback_data 复用"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔄 刷新", callback_data=callback_data)]])
+
+
+@functools.lru_cache(maxsize=1024)
+def _build_mute_action_markup(symbol: str) -> InlineKeyboardMarkup:
+    """已静音代币的操作键盘: 取消 / 延长 / 返回"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔊 取消静音", callback_data=f"unmute_symbol_{symbol}")],
+        [
+            InlineKeyboardButton("⏰ +1小时", callback_data=f"extend_mute_{symbol}_60"),
+            InlineKeyboardButton("⏰ +24小时", callback_data=f"extend_mute_{symbol}_1440"),
+        ],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+@functools.lru_cache(maxsize=1024)
+def _build_unmute_markup(symbol: str, label: str = "🔊 取消静音") -> InlineKeyboardMarkup:
+    """静音 / 延长后的键盘: 取消静音 + 返回"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=f"unmute_symbol_{symbol}")],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+# 成交额筛选档位 (金额, 按钮文字)，按行排列
+_VOLUME_TIERS = (
+    (1_000_000, "$1M"), (5_000_000, "$5M"), (10_000_000, "$10M"),
+    (50_000_000, "$50M"), (100_000_000, "$100M"), (500_000_000, "$500M"),
+    (1_000_000_000, "$1B"), (5_000_000_000, "$5B"),
+)
+_VOLUME_TIER_VALUES = tuple(v for v, _ in _VOLUME_TIERS)
+_VOLUME_TIER_ROWS = ((0, 1, 2), (3, 4, 5), (6, 7))
+
+
+def _volume_tier_index(current: float) -> int:
+    """当前金额对应的档位下标 (误差 1% 内)，不在任何档位时返回 -1"""
+    i = bisect_right(_VOLUME_TIER_VALUES, current)
+    # 档位间隔远大于 1%，只需比较两侧相邻档位
+    for j in (i - 1, i):
+        if 0 <= j < len(_VOLUME_TIER_VALUES):
+            val = _VOLUME_TIER_VALUES[j]
+            if abs(current - val) < val * 0.01:
+                return j
+    return -1
+
+
+@functools.lru_cache(maxsize=32)
+def _build_volume_filter_markup(enabled: bool, selected: int) -> InlineKeyboardMarkup:
+    """成交额筛选键盘 (按开关与选中档位缓存)"""
+    rows = [
+        # 开关按钮
+        [InlineKeyboardButton(
+            '🔴 关闭筛选' if enabled else '🟢 开启筛选',
+            callback_data="toggle_volume_filter"
+        )],
+    ]
+    # 常用档位 - 小额 / 中额 / 大额
+    for row in _VOLUME_TIER_ROWS:
+        rows.append([
+            InlineKeyboardButton(
+                f"{'✅ ' if i == selected else ''}{_VOLUME_TIERS[i][1]}",
+                callback_data=f"minvol_{_VOLUME_TIERS[i][0]}"
+            )
+            for i in row
+        ])
+    rows.append([InlineKeyboardButton("◀️ 返回监控类型", callback_data="menu_switches")])
+    return InlineKeyboardMarkup(rows)
+
+
+@functools.lru_cache(maxsize=32)
+def _build_night_markup(enabled: bool, night_add_email: bool) -> InlineKeyboardMarkup:
+    """夜间模式键盘 - 紧急配置 (按开关组合缓存)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            f"{'🔴 关闭' if enabled else '🟢 开启'} 夜间模式", 
+            callback_data="toggle_night"
+        )],
+        [
+            InlineKeyboardButton("⏰ 22:00-07:00", callback_data="night_time_22_07"),
+            InlineKeyboardButton("⏰ 23:00-08:00", callback_data="night_time_23_08"),
+        ],
+        [
+            InlineKeyboardButton("⏰ 00:00-09:00", callback_data="night_time_00_09"),
+        ],
+        # 更短的间隔选项
+        [
+            InlineKeyboardButton("🔥10秒", callback_data="night_interval_10"),
+            InlineKeyboardButton("15秒", callback_data="night_interval_15"),
+            InlineKeyboardButton("30秒", callback_data="night_interval_30"),
+        ],
+        # 更多的重复次数
+        [
+            InlineKeyboardButton("20次", callback_data="night_max_20"),
+            InlineKeyboardButton("🔥30次", callback_data="night_max_30"),
+            InlineKeyboardButton("50次", callback_data="night_max_50"),
+        ],
+        [InlineKeyboardButton(
+            f"{'✅' if night_add_email else '⬜'} 夜间加邮件通知", 
+            callback_data="toggle_night_email"
+        )],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+@functools.lru_cache(maxsize=32)
+def _build_mode_markup(mode: AlertMode) -> InlineKeyboardMarkup:
+    """报警模式键盘 (按当前模式缓存)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{'✅' if mode == AlertMode.SINGLE else '⬜'} 📢 单次报警", callback_data="mode_single")],
+        [InlineKeyboardButton(f"{'✅' if mode == AlertMode.REPEAT else '⬜'} 🔁 重复提醒(紧急)", callback_data="mode_repeat")],
+        # 重复间隔快捷设置
+        [
+            InlineKeyboardButton("🔥10秒", callback_data="repeat_interval_10"),
+            InlineKeyboardButton("15秒", callback_data="repeat_interval_15"),
+            InlineKeyboardButton("30秒", callback_data="repeat_interval_30"),
+        ],
+        # 重复次数快捷设置
+        [
+            InlineKeyboardButton("20次", callback_data="repeat_max_20"),
+            InlineKeyboardButton("🔥30次", callback_data="repeat_max_30"),
+            InlineKeyboardButton("50次", callback_data="repeat_max_50"),
+        ],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+# 监控类型开关: callback_data -> UserConfig 字段
+_TOGGLE_MAP: Dict[str, str] = {
+    "toggle_spot": "enable_spot",
+    "toggle_futures": "enable_futures",
+    "toggle_spread": "enable_spread",
+    "toggle_volume": "enable_volume",
+    "toggle_funding": "enable_funding",
+    "toggle_big_order": "enable_big_order",
+}
+
+# 开关状态显示 (按 bool 下标取值)
+_CHECK = ('❌', '✅')
+_BOX = ('⬜', '✅')
+_VOLUME_FILTER_HINT = ('💡 未开启，监控所有代币', '💡 已开启，仅监控大成交额代币')
+
+_SWITCHES_TEMPLATE = (
+    "🎚️ <b>监控类型设置</b>\n\n"
+    "<b>报警开关:</b>\n"
+    "• 现货: %s\n"
+    "• 合约: %s\n"
+    "• 差价: %s\n"
+    "• 成交量异动: %s\n"
+    "• 资金费率: %s\n"
+    "• 🐋 巨量挂单: %s\n\n"
+    "<b>成交额筛选:</b> %s\n"
+    "%s\n\n"
+    "<b>💡 巨量挂单说明:</b>\n"
+    "检测订单簿中的超大额买/卖挂单\n"
+    "• 小市值币: ≥$500K 或占24h成交额20%%\n"
+    "• 大市值币: ≥$5M 或占24h成交额5%%"
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _build_switches_markup(spot: bool, futures: bool, spread: bool, volume: bool,
+                           funding: bool, big_order: bool, volume_display: str) -> InlineKeyboardMarkup:
+    """监控类型开关键盘 (按开关组合缓存)"""
+    box = _BOX
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{box[spot]} 现货报警", callback_data="toggle_spot")],
+        [InlineKeyboardButton(f"{box[futures]} 合约报警", callback_data="toggle_futures")],
+        [InlineKeyboardButton(f"{box[spread]} 差价报警", callback_data="toggle_spread")],
+        [InlineKeyboardButton(f"{box[volume]} 成交量异动", callback_data="toggle_volume")],
+        [InlineKeyboardButton(f"{box[funding]} 资金费率", callback_data="toggle_funding")],
+        [InlineKeyboardButton(f"{box[big_order]} 🐋 巨量挂单", callback_data="toggle_big_order")],
+        [InlineKeyboardButton(f"💎 成交额筛选: {volume_display}", callback_data="menu_volume_filter")],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+# 主菜单键盘与用户状态无关
+_MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📊 排行榜", callback_data="menu_rank"),
+        InlineKeyboardButton("🔔 待确认", callback_data="menu_pending"),
+    ],
+    [
+        InlineKeyboardButton("🌍 时区", callback_data="menu_timezone"),
+        InlineKeyboardButton("👁️ 监控", callback_data="menu_watch"),
+    ],
+    [
+        InlineKeyboardButton("🎯 灵敏度", callback_data="menu_profile"),
+        InlineKeyboardButton("🔔 模式", callback_data="menu_mode"),
+    ],
+    [
+        InlineKeyboardButton("✅ 白名单", callback_data="menu_whitelist"),
+        InlineKeyboardButton("🚫 黑名单", callback_data="menu_blacklist"),
+    ],
+    [
+        InlineKeyboardButton("🌙 夜间模式", callback_data="menu_night"),
+        InlineKeyboardButton("📧 邮件", callback_data="menu_email"),
+    ],
+    [
+        InlineKeyboardButton("⚙️️ 监控类型", callback_data="menu_switches"),
+    ],
+])
+
+# 控制面板里的排行榜菜单，同样是静态键盘
+_RANK_MENU_MARKUP = InlineKeyboardMarkup([
+    # 现货
+    [InlineKeyboardButton("━━━ 📈 现货 ━━━", callback_data="noop")],
+    [
+        InlineKeyboardButton("🟢 涨幅", callback_data="rank_gainers_spot"),
+        InlineKeyboardButton("🔴 跌幅", callback_data="rank_losers_spot"),
+        InlineKeyboardButton("💰 成交额", callback_data="rank_volume_spot"),
+    ],
+    # 合约
+    [InlineKeyboardButton("━━━ 📊 合约 ━━━", callback_data="noop")],
+    [
+        InlineKeyboardButton("🟢 涨幅", callback_data="rank_gainers_futures"),
+        InlineKeyboardButton("🔴 跌幅", callback_data="rank_losers_futures"),
+        InlineKeyboardButton("💰 成交额", callback_data="rank_volume_futures"),
+    ],
+    # 期现数据
+    [InlineKeyboardButton("━━━ 📐 期现 ━━━", callback_data="noop")],
+    [
+        InlineKeyboardButton("📐 差价", callback_data="rank_spread"),
+        InlineKeyboardButton("📈 费率+", callback_data="rank_funding_pos"),
+        InlineKeyboardButton("📉 费率-", callback_data="rank_funding_neg"),
+    ],
+    [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+])
+
+
+@functools.lru_cache(maxsize=8)
+def _build_watch_markup(watch_mode: str) -> InlineKeyboardMarkup:
+    """监控模式键盘 (按当前模式缓存)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{'✅' if watch_mode == 'all' else '⬜'} 全部", callback_data="watch_all")],
+        [InlineKeyboardButton(f"{'✅' if watch_mode == 'whitelist' else '⬜'} 仅白名单", callback_data="watch_whitelist")],
+        [InlineKeyboardButton(f"{'✅' if watch_mode == 'blacklist' else '⬜'} 排除黑名单", callback_data="watch_blacklist")],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+@functools.lru_cache(maxsize=8)
+def _build_profile_markup(profile: AlertProfile) -> InlineKeyboardMarkup:
+    """灵敏度键盘 (按当前档位缓存)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{'✅' if profile == AlertProfile.CONSERVATIVE else '⬜'} 🟢 保守", callback_data="profile_conservative")],
+        [InlineKeyboardButton(f"{'✅' if profile == AlertProfile.MODERATE else '⬜'} 🟡 适中", callback_data="profile_moderate")],
+        [InlineKeyboardButton(f"{'✅' if profile == AlertProfile.AGGRESSIVE else '⬜'} 🔴 激进", callback_data="profile_aggressive")],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
+
+@functools.lru_cache(maxsize=32)
+def _build_timezone_markup(current_offset: int) -> InlineKeyboardMarkup:
+    """时区键盘，两列排布 (按当前偏移缓存，只有勾选位置随用户变化)"""
+    buttons = [
+        InlineKeyboardButton(f"{'✅' if offset == current_offset else ''}{name}", callback_data=data)
+        for data, (offset, name) in _TZ_CALLBACKS.items()
+    ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    keyboard.append([InlineKeyboardButton("◀️ 返回", callback_data="back_menu")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+@functools.lru_cache(maxsize=2)
+def _build_email_markup(enabled: bool) -> InlineKeyboardMarkup:
+    """邮件开关键盘"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{'🔴 关闭' if enabled else '🟢 开启'} 邮件", callback_data="toggle_email")],
+        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
+    ])
+
 
 class TelegramBot:
     """多用户Telegram机器人"""
@@ -32,54 +506,157 @@ class TelegramBot:
         self.notifier = notifier
         self.app: Optional[Application] = None
         self.system: Optional['CoinWhistleSystem'] = None
+        self._alert_engine = None
+        
+        # 回调路由: callback_data 第一个 "_" 之前的前缀 -> 处理方法
+        # 完整匹配的静态回调，优先查找
+        self._cb_exact = {
+            "noop": self._cb_noop,
+            "confirm_all_alerts": self._cb_confirm_all,
+            "toggle_volume_filter": self._cb_toggle_volume_filter,
+            "toggle_night": self._cb_toggle_night,
+            "toggle_night_email": self._cb_toggle_night_email,
+            "toggle_email": self._cb_toggle_email,
+            "menu_volume_filter": self._cb_menu_volume_filter,
+            "back_menu": self._cb_back,
+            "clear_whitelist": self._cb_clear_whitelist,
+            "clear_blacklist": self._cb_clear_blacklist,
+        }
+        # 菜单导航: menu_<name> -> 渲染方法
+        self._menu_routes = {
+            "menu_watch": self._show_watch_menu,
+            "menu_profile": self._show_profile_menu,
+            "menu_mode": self._show_mode_menu,
+            "menu_night": self._show_night_menu,
+            "menu_email": self._show_email_menu,
+            "menu_switches": self._show_switches_menu,
+            "menu_timezone": self._show_timezone_menu,
+            "menu_whitelist": functools.partial(self._show_list_menu, list_type="whitelist"),
+            "menu_blacklist": functools.partial(self._show_list_menu, list_type="blacklist"),
+            "menu_rank": self._show_rank_menu,
+            "menu_pending": self._show_pending_menu,
+        }
+        # 排行榜: rank_<kind>[_<arg>] -> 渲染方法 (参数预先绑定)
+        self._rank_routes = {
+            "rank_spread": functools.partial(self._show_spread_rank, edit=True),
+            "rank_funding_pos": functools.partial(self._show_funding_rank, positive=True, edit=True),
+            "rank_funding_neg": functools.partial(self._show_funding_rank, positive=False, edit=True),
+        }
+        for market in MarketType:
+            self._rank_routes[f"rank_gainers_{market.value}"] = functools.partial(self._show_gainers, market=market, edit=True)
+            self._rank_routes[f"rank_losers_{market.value}"] = functools.partial(self._show_losers, market=market, edit=True)
+            self._rank_routes[f"rank_volume_{market.value}"] = functools.partial(self._show_volume_rank, market=market, edit=True)
+        # 带参数的回调，按第一个前缀分发
+        self._cb_routes = {
+            "confirm": self._cb_confirm,
+            "toggle": self._handle_toggle,
+            "minvol": self._cb_minvol,
+            "menu": self._handle_menu_navigation,
+            "mute": self._cb_mute,
+            "unmute": self._cb_unmute,
+            "extend": self._cb_extend,
+            "tz": self._cb_tz,
+            "repeat": self._cb_repeat,
+            "night": self._cb_night,
+            "rank": self._handle_rank_callback,
+            "info": self._cb_info,
+            "watch": self._cb_watch,
+            "profile": self._cb_profile,
+            "mode": self._cb_mode,
+        }
+        
+        # /top 排行榜键盘与用户状态无关，只构建一次
+        self._top_markup = InlineKeyboardMarkup([
+            # 现货
+            [InlineKeyboardButton("━━━ 📈 现货 ━━━", callback_data="noop")],
+            [
+                InlineKeyboardButton("🟢 涨幅榜", callback_data="rank_gainers_spot"),
+                InlineKeyboardButton("🔴 跌幅榜", callback_data="rank_losers_spot"),
+            ],
+            [
+                InlineKeyboardButton("💰 成交额榜", callback_data="rank_volume_spot"),
+            ],
+            # 合约
+            [InlineKeyboardButton("━━━ 📊 合约 ━━━", callback_data="noop")],
+            [
+                InlineKeyboardButton("🟢 涨幅榜", callback_data="rank_gainers_futures"),
+                InlineKeyboardButton("🔴 跌幅榜", callback_data="rank_losers_futures"),
+            ],
+            [
+                InlineKeyboardButton("💰 成交额榜", callback_data="rank_volume_futures"),
+            ],
+            # 合约特有
+            [InlineKeyboardButton("━━━ 📐 期现数据 ━━━", callback_data="noop")],
+            [
+                InlineKeyboardButton("📐 差价榜", callback_data="rank_spread"),
+            ],
+            [
+                InlineKeyboardButton("📈 费率(正)", callback_data="rank_funding_pos"),
+                InlineKeyboardButton("📉 费率(负)", callback_data="rank_funding_neg"),
+            ],
+        ])
+        
+        # 临时静音记录: {(user_id, symbol): 到期时刻 time.monotonic()}
+        self._mute_until: Dict[Tuple[str, str], float] = {}
+        # 到期小顶堆 (到期时刻, user_id, symbol)；取消/延长时不删堆元素，弹出时与 _mute_until 比对
+        self._mute_heap: List[Tuple[float, str, str]] = []
+        self._mute_wakeup = asyncio.Event()
+        self._mute_task: Optional[asyncio.Task] = None
         
-        # 临时静音记录: {user_id: {symbol: unmute_time}}
-        self.muted_symbols: Dict[str, Dict[str, datetime]] = {}
+        # 排行榜缓存: {(方法名, *参数): (生成时刻, 数据)}
+        self._rank_cache: Dict[tuple, Tuple[float, list]] = {}
+        
+        # 进行中的回调处理任务 (持有引用防止被回收，停止时统一取消)
+        self._inflight: Set[asyncio.Task] = set()
+        
+        # 待执行的合并重绘: {(chat_id, message_id): 定时器}
+        self._pending_edits: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
     
     def set_system(self, system: 'CoinWhistleSystem'):
         self.system = system
+        self._alert_engine = getattr(system, 'alert_engine', None)
     
     async def start(self):
         """启动"""
         self.app = Application.builder().token(self.token).build()
         
-        commands = [
-            ("start", self._cmd_start),
-            ("help", self._cmd_help),
-            ("menu", self._cmd_menu),
-            ("status", self._cmd_status),
-            ("config", self._cmd_config),
-            ("profile", self._cmd_profile),
-            ("mode", self._cmd_mode),
-            ("watch", self._cmd_watch),
-            ("whitelist", self._cmd_whitelist),
-            ("blacklist", self._cmd_blacklist),
-            ("email", self._cmd_email),
-            ("night", self._cmd_night),
-            ("timezone", self._cmd_timezone),
-            ("tz", self._cmd_timezone),
-            ("confirm", self._cmd_confirm),
-            ("pending", self._cmd_pending),
-            ("minvol", self._cmd_minvol),
-            ("filter", self._cmd_minvol),
-            ("test", self._cmd_test),
+        commands = {
+            "start": self._cmd_start,
+            "help": self._cmd_help,
+            "menu": self._cmd_menu,
+            "status": self._cmd_status,
+            "config": self._cmd_config,
+            "profile": self._cmd_profile,
+            "mode": self._cmd_mode,
+            "watch": self._cmd_watch,
+            "whitelist": self._cmd_whitelist,
+            "blacklist": self._cmd_blacklist,
+            "email": self._cmd_email,
+            "night": self._cmd_night,
+            "timezone": self._cmd_timezone,
+            "tz": self._cmd_timezone,
+            "confirm": self._cmd_confirm,
+            "pending": self._cmd_pending,
+            "minvol": self._cmd_minvol,
+            "filter": self._cmd_minvol,
+            "test": self._cmd_test,
             # 排行榜命令
-            ("top", self._cmd_top),
-            ("rank", self._cmd_top),
-            ("gainers", self._cmd_gainers),
-            ("losers", self._cmd_losers),
-            ("volume", self._cmd_volume),
-            ("spread", self._cmd_spread),
-            ("funding", self._cmd_funding),
-            ("price", self._cmd_price),
-            ("info", self._cmd_info),
+            "top": self._cmd_top,
+            "rank": self._cmd_top,
+            "gainers": self._cmd_gainers,
+            "losers": self._cmd_losers,
+            "volume": self._cmd_volume,
+            "spread": self._cmd_spread,
+            "funding": self._cmd_funding,
+            "price": self._cmd_price,
+            "info": self._cmd_info,
             # 管理员
-            ("admin", self._cmd_admin),
-            ("users", self._cmd_users),
-            ("broadcast", self._cmd_broadcast),
-        ]
+            "admin": self._cmd_admin,
+            "users": self._cmd_users,
+            "broadcast": self._cmd_broadcast,
+        }
         
-        for cmd, handler in commands:
+        for cmd, handler in commands.items():
             self.app.add_handler(CommandHandler(cmd, handler))
         
         self.app.add_handler(CallbackQueryHandler(self._handle_callback))
@@ -89,13 +666,23 @@ class TelegramBot:
         await self._set_commands()
         await self.app.updater.start_polling(drop_pending_updates=True)
         
-        # 启动静音清理任务
-        asyncio.create_task(self._mute_cleanup_loop())
+        self._mute_task = asyncio.create_task(self._mute_expiry_loop())
         
         logger.info("Telegram机器人已启动")
     
     async def stop(self):
         """停止机器人"""
+        # 停止静音到期调度
+        if self._mute_task:
+            self._mute_task.cancel()
+        
+        for handle in self._pending_edits.values():
+            handle.cancel()
+        self._pending_edits.clear()
+        
+        for task in list(self._inflight):
+            task.cancel()
+        
         if self.app:
             try:
                 if self.app.updater and self.app.updater.running:
@@ -142,37 +729,18 @@ class TelegramBot:
         
         # 🔧 用户能发消息说明没有屏蔽机器人，自动恢复活跃状态
         if not user_config.is_active:
-            user_manager.update_user(user_id, is_active=True)
-            user_config = user_manager.get_user(user_id)
+            user_config = user_manager.update_user(user_id, is_active=True)
             logger.info(f"用户自动恢复活跃: {user_id}")
         
-        # 更新 chat_id（可能变化）
-        if chat_id != user_config.chat_id:
-            user_manager.update_user(user_id, chat_id=chat_id)
-            user_config = user_manager.get_user(user_id)
-        
         return user_config
     
     def _format_volume(self, v: float) -> str:
         """格式化成交额"""
-        if v >= 1_000_000_000:
-            return f"${v/1_000_000_000:.2f}B"
-        elif v >= 1_000_000:
-            return f"${v/1_000_000:.2f}M"
-        elif v >= 1_000:
-            return f"${v/1_000:.2f}K"
-        return f"${v:.2f}"
+        return _format_volume(v)
     
     def _format_price(self, p: float) -> str:
         """格式化价格"""
-        if p >= 1000:
-            return f"${p:,.2f}"
-        elif p >= 1:
-            return f"${p:.4f}"
-        elif p >= 0.0001:
-            return f"${p:.6f}"
-        else:
-            return f"${p:.8f}"
+        return _format_price(p)
     
     def _mute_symbol_for_user(self, user_id: str, symbol: str, minutes: int) -> int:
         """
@@ -180,9 +748,7 @@ class TelegramBot:
         返回被移除的待处理报警数量
         """
         user_id = str(user_id)
-        symbol = symbol.upper()
-        if not symbol.endswith('USDT'):
-            symbol += 'USDT'
+        symbol = _norm(symbol)
         
         # 1. 添加到黑名单
         user_manager.add_to_blacklist(user_id, [symbol])
@@ -191,14 +757,11 @@ class TelegramBot:
         removed_count = self.notifier.remove_alerts_for_symbol(user_id, symbol)
         
         # 3. 清除报警引擎中该代币的冷却记录（可选）
-        if self.system and hasattr(self.system, 'alert_engine'):
-            self.system.alert_engine.clear_cooldowns(user_id=user_id, symbol=symbol)
+        if self._alert_engine is not None:
+            self._alert_engine.clear_cooldowns(user_id=user_id, symbol=symbol)
         
-        # 4. 记录自动解除时间
-        if user_id not in self.muted_symbols:
-            self.muted_symbols[user_id] = {}
-        unmute_time = datetime.now() + timedelta(minutes=minutes)
-        self.muted_symbols[user_id][symbol] = unmute_time
+        # 4. 记录自动解除时间并安排定时解除
+        self._set_mute_timer(user_id, symbol, minutes * 60)
         
         logger.info(f"静音代币: {symbol} for {user_id}, 移除 {removed_count} 个待处理报警, {minutes}分钟后解除")
         
@@ -207,56 +770,122 @@ class TelegramBot:
     def _unmute_symbol_for_user(self, user_id: str, symbol: str):
         """取消静音的统一方法"""
         user_id = str(user_id)
-        symbol = symbol.upper()
-        if not symbol.endswith('USDT'):
-            symbol += 'USDT'
+        symbol = _norm(symbol)
         
         # 从黑名单移除
         user_manager.remove_from_blacklist(user_id, [symbol])
         
         # 清除定时记录
-        if user_id in self.muted_symbols:
-            self.muted_symbols[user_id].pop(symbol, None)
+        self._cancel_mute_timer(user_id, symbol)
         
         logger.info(f"取消静音: {symbol} for {user_id}")
     
-    async def _mute_cleanup_loop(self):
-        """定期清理过期的静音并发送恢复通知"""
+    def _get_mute_remaining(self, user_id: str, symbol: str) -> Optional[float]:
+        """获取临时静音剩余秒数，没有临时静音或已到期时返回 None"""
+        deadline = self._mute_until.get((user_id, symbol))
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                return remaining
+        return None
+    
+    def _set_mute_timer(self, user_id: str, symbol: str, seconds: float):
+        """记录到期时刻并加入到期堆（替换已有记录）"""
+        deadline = time.monotonic() + max(seconds, 0)
+        self._mute_until[(user_id, symbol)] = deadline
+        heapq.heappush(self._mute_heap, (deadline, user_id, symbol))
+        self._mute_wakeup.set()
+    
+    def _extend_mute_timer(self, user_id: str, symbol: str, seconds: float) -> float:
+        """在现有到期时刻 (已过期则从现在) 上延长，返回延长后的剩余秒数"""
+        key = (user_id, symbol)
+        now = time.monotonic()
+        current = self._mute_until.get(key)
+        deadline = (current if current is not None and current > now else now) + max(seconds, 0)
+        self._mute_until[key] = deadline
+        heapq.heappush(self._mute_heap, (deadline, user_id, symbol))
+        self._mute_wakeup.set()
+        return deadline - now
+    
+    def _cancel_mute_timer(self, user_id: str, symbol: str):
+        """删除定时解除记录 (堆中旧元素到期时自动跳过)"""
+        self._mute_until.pop((user_id, symbol), None)
+    
+    def _cancel_mute_timers(self, user_id: str, symbols: List[str]):
+        """批量删除定时解除记录"""
+        mute_until = self._mute_until
+        for symbol in symbols:
+            mute_until.pop((user_id, symbol), None)
+    
+    def _cancel_user_mute_timers(self, user_id: str):
+        """删除用户全部定时解除记录 (清空黑名单时才用，直接扫描)"""
+        mute_until = self._mute_until
+        for key in [k for k in mute_until if k[0] == user_id]:
+            del mute_until[key]
+    
+    async def _mute_expiry_loop(self):
+        """
+        静音到期调度: 睡到堆顶到期时刻 + 合并窗口，
+        一次弹出全部已到期条目并按用户合并通知
+        """
+        heap = self._mute_heap
+        mute_until = self._mute_until
         while True:
+            now = time.monotonic()
+            expired: Dict[str, List[str]] = {}
+            
+            while heap and heap[0][0] <= now:
+                deadline, user_id, symbol = heapq.heappop(heap)
+                key = (user_id, symbol)
+                # 已取消或已延长 (到期时刻不一致) 的旧条目直接丢弃
+                if mute_until.get(key) != deadline:
+                    continue
+                del mute_until[key]
+                expired.setdefault(user_id, []).append(symbol)
+            
+            for user_id, symbols in expired.items():
+                await self._notify_unmuted(user_id, symbols)
+            
+            # 等到下一个到期时刻之后再多等一个合并窗口，期间新的静音会唤醒重新计算
+            timeout = heap[0][0] + UNMUTE_BATCH_WINDOW - now if heap else None
+            self._mute_wakeup.clear()
             try:
-                await asyncio.sleep(60)
-                now = datetime.now()
-                
-                for user_id in list(self.muted_symbols.keys()):
-                    for symbol in list(self.muted_symbols[user_id].keys()):
-                        if self.muted_symbols[user_id][symbol] <= now:
-                            # 从黑名单移除
-                            user_manager.remove_from_blacklist(user_id, [symbol])
-                            del self.muted_symbols[user_id][symbol]
-                            
-                            name = symbol.replace('USDT', '')
-                            logger.info(f"自动取消静音: {symbol} for {user_id}")
-                            
-                            # 发送恢复通知
-                            user_config = user_manager.get_user(user_id)
-                            if user_config and user_config.is_active:
-                                try:
-                                    await self.notifier.send_message(
-                                        user_config.chat_id,
-                                        f"🔔 <b>{name} 静音已到期</b>\n\n"
-                                        f"已恢复该代币的报警通知\n"
-                                        f"⏰ {user_config.get_local_time_str()}"
-                                    )
-                                except Exception as e:
-                                    logger.error(f"发送静音恢复通知失败: {e}")
-                    
-                    if not self.muted_symbols[user_id]:
-                        del self.muted_symbols[user_id]
-                        
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"静音清理错误: {e}")
+                await asyncio.wait_for(self._mute_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _notify_unmuted(self, user_id: str, symbols: List[str]):
+        """解除到期静音并发送一条合并的恢复通知"""
+        try:
+            # 从黑名单移除
+            user_manager.remove_from_blacklist(user_id, symbols)
+            logger.info(f"自动取消静音: {', '.join(symbols)} for {user_id}")
+            
+            # 发送恢复通知
+            user_config = user_manager.get_user(user_id)
+            if user_config and user_config.is_active:
+                # 发送队列拥堵时跳过恢复通知，不影响报警
+                if self.notifier.is_backpressured:
+                    logger.debug(f"发送队列繁忙，跳过静音到期通知: {user_id}")
+                    return
+                if len(symbols) == 1:
+                    text = (
+                        f"🔔 <b>{symbols[0][:-4]} 静音已到期</b>\n\n"
+                        f"已恢复该代币的报警通知\n"
+                    )
+                else:
+                    lines = "\n".join(f"• {s[:-4]}" for s in symbols)
+                    text = (
+                        f"🔔 <b>以下代币静音已到期</b>\n\n"
+                        f"{lines}\n\n"
+                        f"已恢复这些代币的报警通知\n"
+                    )
+                self.notifier.queue_message(
+                    user_config.chat_id,
+                    f"{text}⏰ {user_config.get_local_time_str()}"
+                )
+        except Exception as e:
+            logger.error(f"自动取消静音失败: {e}")
     
     # ================== 确认报警命令 ==================
     
@@ -272,26 +901,29 @@ class TelegramBot:
                 await update.message.reply_text("✅ 没有待确认的报警")
                 return
             
-            text = f"🔔 <b>待确认报警 ({len(pending)})</b>\n\n"
-            for alert_id, alert in list(pending.items())[:10]:
-                text += f"• <code>{alert_id}</code> {alert.symbol} (已发{alert.sent_count}次)\n"
+            items = list(islice(pending.items(), 10))
+            parts = [f"🔔 <b>待确认报警 ({len(pending)})</b>\n\n"]
+            append = parts.append
+            for alert_id, alert in items:
+                append(f"• <code>{alert_id}</code> {alert.symbol} (已发{alert.sent_count}次)\n")
             
             if len(pending) > 10:
-                text += f"\n... 还有 {len(pending) - 10} 个"
+                append(f"\n... 还有 {len(pending) - 10} 个")
             
             keyboard = [
                 [InlineKeyboardButton("✅ 确认全部", callback_data="confirm_all_alerts")],
             ]
             
-            for alert_id, alert in list(pending.items())[:5]:
+            for alert_id, alert in items[:5]:
                 keyboard.append([
                     InlineKeyboardButton(
-                        f"确认 {alert.symbol.replace('USDT', '')} ({alert_id})", 
+                        f"确认 {alert.symbol[:-4]} ({alert_id})", 
                         callback_data=f"confirm_alert_{alert_id}"
                     )
                 ])
             
-            text += "\n\n💡 /confirm all 确认全部"
+            append("\n\n💡 /confirm all 确认全部")
+            text = "".join(parts)
             
             await update.message.reply_text(
                 text, 
@@ -325,32 +957,36 @@ class TelegramBot:
             await update.message.reply_text("✅ 没有待确认的报警")
             return
         
-        text = f"🔔 <b>待确认报警 ({len(pending)})</b>\n\n"
+        parts = [f"🔔 <b>待确认报警 ({len(pending)})</b>\n\n"]
+        append = parts.append
         
-        for alert_id, alert in list(pending.items())[:10]:
-            text += f"• <code>{alert_id}</code>\n"
-            text += f"  {alert.symbol} | {alert.message[:25]}...\n"
-            text += f"  已发送 {alert.sent_count} 次\n\n"
+        items = list(islice(pending.items(), 10))
+        for alert_id, alert in items:
+            append(
+                f"• <code>{alert_id}</code>\n"
+                f"  {alert.symbol} | {alert.message[:25]}...\n"
+                f"  已发送 {alert.sent_count} 次\n\n"
+            )
         
         if len(pending) > 10:
-            text += f"... 还有 {len(pending) - 10} 个\n"
+            append(f"... 还有 {len(pending) - 10} 个\n")
         
         keyboard = [
             [InlineKeyboardButton("✅ 确认全部", callback_data="confirm_all_alerts")],
         ]
         
-        for alert_id, alert in list(pending.items())[:3]:
-            name = alert.symbol.replace('USDT', '')
+        for alert_id, alert in items[:3]:
             keyboard.append([
                 InlineKeyboardButton(
-                    f"✅ 确认 {name}", 
+                    f"✅ 确认 {alert.symbol[:-4]}", 
                     callback_data=f"confirm_alert_{alert_id}"
                 )
             ])
         
         keyboard.append([InlineKeyboardButton("◀️ 返回", callback_data="back_menu")])
         
-        text += "\n💡 点击按钮确认或输入 /confirm all"
+        append("\n💡 点击按钮确认或输入 /confirm all")
+        text = "".join(parts)
         
         await update.message.reply_text(
             text, 
@@ -364,43 +1000,13 @@ class TelegramBot:
         """排行榜菜单"""
         user_config = self._get_user(update)
         
-        keyboard = [
-            # 现货
-            [InlineKeyboardButton("━━━ 📈 现货 ━━━", callback_data="noop")],
-            [
-                InlineKeyboardButton("🟢 涨幅榜", callback_data="rank_gainers_spot"),
-                InlineKeyboardButton("🔴 跌幅榜", callback_data="rank_losers_spot"),
-            ],
-            [
-                InlineKeyboardButton("💰 成交额榜", callback_data="rank_volume_spot"),
-            ],
-            # 合约
-            [InlineKeyboardButton("━━━ 📊 合约 ━━━", callback_data="noop")],
-            [
-                InlineKeyboardButton("🟢 涨幅榜", callback_data="rank_gainers_futures"),
-                InlineKeyboardButton("🔴 跌幅榜", callback_data="rank_losers_futures"),
-            ],
-            [
-                InlineKeyboardButton("💰 成交额榜", callback_data="rank_volume_futures"),
-            ],
-            # 合约特有
-            [InlineKeyboardButton("━━━ 📐 期现数据 ━━━", callback_data="noop")],
-            [
-                InlineKeyboardButton("📐 差价榜", callback_data="rank_spread"),
-            ],
-            [
-                InlineKeyboardButton("📈 费率(正)", callback_data="rank_funding_pos"),
-                InlineKeyboardButton("📉 费率(负)", callback_data="rank_funding_neg"),
-            ],
-        ]
-        
         local_time = user_config.get_local_time_str()
         
         await update.message.reply_text(
             f"📊 <b>实时排行榜</b>\n\n"
             f"选择要查看的排行:\n\n"
             f"⏰ {local_time}",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=self._top_markup,
             parse_mode=ParseMode.HTML
         )
     
@@ -436,188 +1042,222 @@ class TelegramBot:
             )
             return
         
-        symbol = args[0].upper()
-        if not symbol.endswith('USDT'):
-            symbol += 'USDT'
+        symbol = _norm(args[0])
         
         await self._show_token_info(update.message, user_config, symbol)
     
     async def _cmd_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self._cmd_price(update, context)
     
+    def _get_rank(self, fetch, *args) -> list:
+        """排行榜数据短时缓存，RANK_CACHE_TTL 内重复请求直接复用排序结果"""
+        key = (fetch.__name__,) + args
+        now = time.monotonic()
+        cached = self._rank_cache.get(key)
+        if cached and now - cached[0] < RANK_CACHE_TTL:
+            return cached[1]
+        
+        data = fetch(*args)
+        self._rank_cache[key] = (now, data)
+        return data
+    
     async def _show_gainers(self, message: Message, user_config: UserConfig, 
                             market: MarketType, edit: bool = False):
         if not self.system:
             return
         
-        gainers = self.system.binance.get_top_gainers(15, market)
-        market_name = "现货" if market == MarketType.SPOT else "合约"
-        market_icon = "📈" if market == MarketType.SPOT else "📊"
+        gainers = self._get_rank(self.system.binance.get_top_gainers, 15, market)
+        market_name, market_icon = _MARKET_META[market]
         
-        text = f"🟢 <b>{market_icon} {market_name}涨幅榜 TOP 15</b>\n\n"
+        parts = [f"🟢 <b>{market_icon} {market_name}涨幅榜 TOP 15</b>\n\n"]
+        append = parts.append
+        fp = _format_price
+        fv = _format_volume
         
         for i, (symbol, price, change, volume) in enumerate(gainers, 1):
-            name = symbol.replace('USDT', '')
-            text += f"{i}. <b>{name}</b>\n"
-            text += f"   💰 {self._format_price(price)} | 📈 +{change:.2f}%\n"
-            text += f"   📊 {self._format_volume(volume)}\n\n"
+            append(
+                f"{i}. <b>{symbol[:-4]}</b>\n"
+                f"   💰 {fp(price)} | 📈 +{change:.2f}%\n"
+                f"   📊 {fv(volume)}\n\n"
+            )
         
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data=f"rank_gainers_{market.value}")]]
+        markup = _refresh_markup(f"rank_gainers_{market.value}")
         
         if edit:
-            await message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
         else:
-            await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     async def _show_losers(self, message: Message, user_config: UserConfig,
                            market: MarketType, edit: bool = False):
         if not self.system:
             return
         
-        losers = self.system.binance.get_top_losers(15, market)
-        market_name = "现货" if market == MarketType.SPOT else "合约"
-        market_icon = "📈" if market == MarketType.SPOT else "📊"
+        losers = self._get_rank(self.system.binance.get_top_losers, 15, market)
+        market_name, market_icon = _MARKET_META[market]
         
-        text = f"🔴 <b>{market_icon} {market_name}跌幅榜 TOP 15</b>\n\n"
+        parts = [f"🔴 <b>{market_icon} {market_name}跌幅榜 TOP 15</b>\n\n"]
+        append = parts.append
+        fp = _format_price
+        fv = _format_volume
         
         for i, (symbol, price, change, volume) in enumerate(losers, 1):
-            name = symbol.replace('USDT', '')
-            text += f"{i}. <b>{name}</b>\n"
-            text += f"   💰 {self._format_price(price)} | 📉 {change:.2f}%\n"
-            text += f"   📊 {self._format_volume(volume)}\n\n"
+            append(
+                f"{i}. <b>{symbol[:-4]}</b>\n"
+                f"   💰 {fp(price)} | 📉 {change:.2f}%\n"
+                f"   📊 {fv(volume)}\n\n"
+            )
         
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data=f"rank_losers_{market.value}")]]
+        markup = _refresh_markup(f"rank_losers_{market.value}")
         
         if edit:
-            await message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
         else:
-            await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     async def _show_volume_rank(self, message: Message, user_config: UserConfig, 
                                 market: MarketType = MarketType.SPOT, edit: bool = False):
         if not self.system:
             return
         
-        items = self.system.binance.get_top_volume(15, market)
-        market_name = "现货" if market == MarketType.SPOT else "合约"
-        market_icon = "📈" if market == MarketType.SPOT else "📊"
+        items = self._get_rank(self.system.binance.get_top_volume, 15, market)
+        market_name, market_icon = _MARKET_META[market]
         
-        text = f"💰 <b>{market_icon} {market_name} 24H成交额榜 TOP 15</b>\n\n"
+        parts = [f"💰 <b>{market_icon} {market_name} 24H成交额榜 TOP 15</b>\n\n"]
+        append = parts.append
+        fp = _format_price
+        fv = _format_volume
         
         for i, (symbol, price, change, volume) in enumerate(items, 1):
-            name = symbol.replace('USDT', '')
             emoji = "🟢" if change > 0 else "🔴" if change < 0 else "⚪"
-            text += f"{i}. <b>{name}</b>\n"
-            text += f"   💰 {self._format_price(price)} | {emoji} {change:+.2f}%\n"
-            text += f"   📊 {self._format_volume(volume)}\n\n"
+            append(
+                f"{i}. <b>{symbol[:-4]}</b>\n"
+                f"   💰 {fp(price)} | {emoji} {change:+.2f}%\n"
+                f"   📊 {fv(volume)}\n\n"
+            )
         
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
         callback = f"rank_volume_{market.value}"
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data=callback)]]
+        markup = _refresh_markup(callback)
         
         if edit:
-            await message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
         else:
-            await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     async def _show_spread_rank(self, message: Message, user_config: UserConfig, edit: bool = False):
         if not self.system:
             return
         
-        spreads = self.system.binance.get_top_spreads(15)
+        spreads = self._get_rank(self.system.binance.get_top_spreads, 15)
         
-        text = "📐 <b>现货合约差价榜 TOP 15</b>\n\n"
+        parts = ["📐 <b>现货合约差价榜 TOP 15</b>\n\n"]
+        append = parts.append
+        fp = _format_price
         
         for i, (symbol, spot, futures, spread, funding) in enumerate(spreads, 1):
-            name = symbol.replace('USDT', '')
             spread_emoji = "🔺" if spread > 0 else "🔻"
-            text += f"{i}. <b>{name}</b>\n"
-            text += f"   现货: {self._format_price(spot)}\n"
-            text += f"   合约: {self._format_price(futures)}\n"
-            text += f"   {spread_emoji} 差价: {spread:+.2f}% | 费率: {funding:.4f}%\n\n"
+            append(
+                f"{i}. <b>{symbol[:-4]}</b>\n"
+                f"   现货: {fp(spot)}\n"
+                f"   合约: {fp(futures)}\n"
+                f"   {spread_emoji} 差价: {spread:+.2f}% | 费率: {funding:.4f}%\n\n"
+            )
         
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data="rank_spread")]]
+        markup = _refresh_markup("rank_spread")
         
         if edit:
-            await message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
         else:
-            await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     async def _show_funding_rank(self, message: Message, user_config: UserConfig, 
                                   positive: bool = True, edit: bool = False):
         if not self.system:
             return
         
-        items = self.system.binance.get_top_funding_rates(15, positive)
+        items = self._get_rank(self.system.binance.get_top_funding_rates, 15, positive)
         
         title = "资金费率最高" if positive else "资金费率最低"
         emoji = "📈" if positive else "📉"
         
-        text = f"{emoji} <b>{title} TOP 15</b>\n\n"
+        parts = [f"{emoji} <b>{title} TOP 15</b>\n\n"]
+        append = parts.append
+        fp = _format_price
         
         for i, (symbol, rate, price) in enumerate(items, 1):
-            name = symbol.replace('USDT', '')
-            text += f"{i}. <b>{name}</b>\n"
-            text += f"   💰 {self._format_price(price)}\n"
-            text += f"   📊 费率: {rate:+.4f}%\n\n"
+            append(
+                f"{i}. <b>{symbol[:-4]}</b>\n"
+                f"   💰 {fp(price)}\n"
+                f"   📊 费率: {rate:+.4f}%\n\n"
+            )
         
-        text += f"\n💡 正费率=多付空, 负费率=空付多"
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append("\n💡 正费率=多付空, 负费率=空付多")
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
         callback = "rank_funding_pos" if positive else "rank_funding_neg"
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data=callback)]]
+        markup = _refresh_markup(callback)
         
         if edit:
-            await message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
         else:
-            await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+            await message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     async def _show_token_info(self, message: Message, user_config: UserConfig, symbol: str):
         if not self.system:
             return
         
-        spot_info = self.system.binance.get_token_info(symbol, MarketType.SPOT)
-        futures_info = self.system.binance.get_token_info(symbol, MarketType.FUTURES)
+        # 两次都是内存行情字典查找，直接同步读取
+        binance = self.system.binance
+        spot_info = binance.get_token_info(symbol, MarketType.SPOT)
+        futures_info = binance.get_token_info(symbol, MarketType.FUTURES)
         
         if not spot_info and not futures_info:
             await message.reply_text(f"❌ 未找到代币: {symbol}")
             return
         
-        name = symbol.replace('USDT', '')
-        text = f"💎 <b>{name} / USDT</b>\n\n"
+        fp = _format_price
+        parts = [f"💎 <b>{symbol[:-4]} / USDT</b>\n\n"]
+        append = parts.append
         
         if spot_info:
             change_emoji = "📈" if spot_info.price_change_percent_24h > 0 else "📉"
-            text += f"<b>📈 现货</b>\n"
-            text += f"价格: {self._format_price(spot_info.price)}\n"
-            text += f"24h: {change_emoji} {spot_info.price_change_percent_24h:+.2f}%\n"
-            text += f"最高: {self._format_price(spot_info.high_24h)}\n"
-            text += f"最低: {self._format_price(spot_info.low_24h)}\n"
-            text += f"成交额: {spot_info.volume_display}\n"
-            text += f"成交笔: {spot_info.trades_24h:,}\n\n"
+            append(f"<b>📈 现货</b>\n")
+            append(f"价格: {fp(spot_info.price)}\n")
+            append(f"24h: {change_emoji} {spot_info.price_change_percent_24h:+.2f}%\n")
+            append(f"最高: {fp(spot_info.high_24h)}\n")
+            append(f"最低: {fp(spot_info.low_24h)}\n")
+            append(f"成交额: {spot_info.volume_display}\n")
+            append(f"成交笔: {spot_info.trades_24h:,}\n\n")
         
         if futures_info:
-            funding = self.system.binance.funding_rates.get(symbol, 0)
-            text += f"<b>📊 合约</b>\n"
-            text += f"价格: {self._format_price(futures_info.price)}\n"
-            text += f"资金费率: {funding:+.4f}%\n"
+            funding = binance.funding_rates.get(symbol, 0)
+            append(f"<b>📊 合约</b>\n")
+            append(f"价格: {fp(futures_info.price)}\n")
+            append(f"资金费率: {funding:+.4f}%\n")
             
             if spot_info:
                 spread = ((futures_info.price - spot_info.price) / spot_info.price) * 100
-                text += f"差价: {spread:+.2f}%\n"
+                append(f"差价: {spread:+.2f}%\n")
         
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data=f"info_{symbol}")]]
+        markup = _refresh_markup(f"info_{symbol}")
         
-        await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+        await message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     # ================== 时区命令 ==================
     
@@ -629,8 +1269,7 @@ class TelegramBot:
             try:
                 offset = int(args[0])
                 if -12 <= offset <= 14:
-                    user_manager.set_timezone(user_config.user_id, offset)
-                    user_config = user_manager.get_user(user_config.user_id)
+                    user_config = user_manager.set_timezone(user_config.user_id, offset)
                     await update.message.reply_text(
                         f"✅ 时区已设置为 UTC{offset:+d}\n"
                         f"当前时间: {user_config.get_local_time_str()}"
@@ -639,21 +1278,7 @@ class TelegramBot:
             except ValueError:
                 pass
         
-        keyboard = []
-        row = []
-        for name, offset in TIMEZONE_PRESETS.items():
-            btn = InlineKeyboardButton(
-                f"{'✅' if user_config.timezone_offset == offset else ''}{name}",
-                callback_data=f"tz_{offset}_{name}"
-            )
-            row.append(btn)
-            if len(row) == 2:
-                keyboard.append(row)
-                row = []
-        if row:
-            keyboard.append(row)
-        
-        keyboard.append([InlineKeyboardButton("◀️ 返回", callback_data="back_menu")])
+        markup = _build_timezone_markup(user_config.timezone_offset)
         
         await update.message.reply_text(
             f"🌍 <b>时区设置</b>\n\n"
@@ -661,78 +1286,28 @@ class TelegramBot:
             f"当前时间: {user_config.get_local_time_str()}\n\n"
             f"选择你的时区:\n\n"
             f"💡 也可以直接输入: <code>/timezone 8</code>",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     # ================== 夜间模式命令 ==================
     
-    def _get_night_keyboard(self, user_config):
+    def _get_night_keyboard(self, user_config) -> InlineKeyboardMarkup:
         """夜间模式键盘 - 紧急配置"""
         night = user_config.alert_mode.night
-        
-        return [
-            [InlineKeyboardButton(
-                f"{'🔴 关闭' if night.enabled else '🟢 开启'} 夜间模式", 
-                callback_data="toggle_night"
-            )],
-            [
-                InlineKeyboardButton("⏰ 22:00-07:00", callback_data="night_time_22_07"),
-                InlineKeyboardButton("⏰ 23:00-08:00", callback_data="night_time_23_08"),
-            ],
-            [
-                InlineKeyboardButton("⏰ 00:00-09:00", callback_data="night_time_00_09"),
-            ],
-            # 更短的间隔选项
-            [
-                InlineKeyboardButton("🔥10秒", callback_data="night_interval_10"),
-                InlineKeyboardButton("15秒", callback_data="night_interval_15"),
-                InlineKeyboardButton("30秒", callback_data="night_interval_30"),
-            ],
-            # 更多的重复次数
-            [
-                InlineKeyboardButton("20次", callback_data="night_max_20"),
-                InlineKeyboardButton("🔥30次", callback_data="night_max_30"),
-                InlineKeyboardButton("50次", callback_data="night_max_50"),
-            ],
-            [InlineKeyboardButton(
-                f"{'✅' if night.night_add_email else '⬜'} 夜间加邮件通知", 
-                callback_data="toggle_night_email"
-            )],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
+        return _build_night_markup(night.enabled, night.night_add_email)
     
-    def _get_mode_keyboard(self, user_config):
+    def _get_mode_keyboard(self, user_config) -> InlineKeyboardMarkup:
         """报警模式键盘"""
-        mode = user_config.alert_mode.mode
-        repeat = user_config.alert_mode.repeat
-        
-        return [
-            [InlineKeyboardButton(f"{'✅' if mode == AlertMode.SINGLE else '⬜'} 📢 单次报警", callback_data="mode_single")],
-            [InlineKeyboardButton(f"{'✅' if mode == AlertMode.REPEAT else '⬜'} 🔁 重复提醒(紧急)", callback_data="mode_repeat")],
-            # 重复间隔快捷设置
-            [
-                InlineKeyboardButton("🔥10秒", callback_data="repeat_interval_10"),
-                InlineKeyboardButton("15秒", callback_data="repeat_interval_15"),
-                InlineKeyboardButton("30秒", callback_data="repeat_interval_30"),
-            ],
-            # 重复次数快捷设置
-            [
-                InlineKeyboardButton("20次", callback_data="repeat_max_20"),
-                InlineKeyboardButton("🔥30次", callback_data="repeat_max_30"),
-                InlineKeyboardButton("50次", callback_data="repeat_max_50"),
-            ],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
-
+        return _build_mode_markup(user_config.alert_mode.mode)
+    
     async def _cmd_night(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """夜间模式设置"""
         user_config = self._get_user(update)
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        local_now, is_night, effective_mode = user_config.time_snapshot()
         night = user_config.alert_mode.night
         
-        keyboard = self._get_night_keyboard(user_config)
+        markup = self._get_night_keyboard(user_config)
         
         await update.message.reply_text(
             f"🌙 <b>夜间模式设置</b>\n\n"
@@ -745,8 +1320,8 @@ class TelegramBot:
             f"<b>最大重复:</b> {night.night_max_repeats} 次\n"
             f"<b>夜间加邮件:</b> {'✅' if night.night_add_email else '❌'}\n\n"
             f"💡 夜间模式开启后，在夜间时段会自动切换为<b>重复提醒</b>模式，确保不错过重要行情\n\n"
-            f"⏰ {user_config.get_local_time_str()}",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            f"⏰ {user_config.get_local_time_str(local_now)}",
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
@@ -766,96 +1341,33 @@ class TelegramBot:
         # 如果用户之前被标记为不活跃，现在重新激活
         was_inactive = not user_config.is_active
         if was_inactive:
-            user_manager.update_user(user_id, is_active=True)
-            user_config = user_manager.get_user(user_id)
+            user_config = user_manager.update_user(user_id, is_active=True)
             logger.info(f"用户重新激活: {user_id} ({user_config.username})")
         
-        # 同时更新 chat_id
-        if str(chat.id) != user_config.chat_id:
-            user_manager.update_user(user_id, chat_id=str(chat.id))
-        
         # 欢迎消息
         reactivate_msg = "\n\n🔔 <b>已重新激活通知！</b>" if was_inactive else ""
         
-        # 加入群组按钮
-        keyboard = [
-            [InlineKeyboardButton("📢 加入交流群", url="https://t.me/+mMYvl04GeTIwODdl")],
-        ]
-        
         await update.message.reply_text(
-            f"🦅 <b>欢迎使用币哨监控系统 v1.3</b>\n\n"
-            f"你好 <b>{user_config.username or '用户'}</b>！{reactivate_msg}\n\n"
-            "📋 <b>快速开始:</b>\n"
-            "• /menu - 控制面板\n"
-            "• /status - 系统状态\n"
-            "• /test - 测试报警\n"
-            "• /top - 排行榜\n"
-            "• /price BTC - 查询价格\n"
-            "• /night - 夜间模式\n"
-            "• /timezone - 设置时区\n"
-            "• /pending - 待确认报警\n"
-            "• /help - 帮助\n\n"
-            "✨ <b>新功能:</b>\n"
-            "• ⚡ 升级穿透 - 级别升级立即报警\n"
-            "• 🌙 夜间模式 - 自动重复提醒实现紧急唤醒",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            _START_TEMPLATE.format(
+                username=user_config.username or '用户',
+                reactivate_msg=reactivate_msg,
+            ),
+            reply_markup=_JOIN_GROUP_MARKUP,
             parse_mode=ParseMode.HTML
         )
     
     async def _cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        # 加入群组按钮
-        keyboard = [
-            [InlineKeyboardButton("📢 加入交流群", url="https://t.me/+mMYvl04GeTIwODdl")],
-        ]
-        
-        help_text = """
-    🦅 <b>币哨监控系统 v1.3 - 帮助</b>
-    
-    <b>📊 排行榜</b>
-    /top - 排行榜菜单
-    /gainers - 涨幅榜
-    /losers - 跌幅榜
-    /volume - 成交额榜
-    /spread - 差价榜
-    /funding - 资金费率
-    /price BTC - 查询价格
-    
-    <b>🔔 报警管理</b>
-    /pending - 待确认报警
-    /confirm - 确认报警列表
-    /confirm all - 确认全部
-    
-    <b>👁️ 监控设置</b>
-    /watch - 监控模式
-    /whitelist add BTC ETH - 白名单
-    /blacklist add SHIB - 黑名单
-    
-    <b>⚙️ 报警设置</b>
-    /profile - 灵敏度
-    /mode - 报警模式
-    /night - 夜间模式 (自动重复提醒)
-    /email xxx@email.com - 邮件
-    
-    <b>🌍 时区</b>
-    /timezone - 时区选择
-    /tz 8 - 直接设置 UTC+8
-    
-    <b>✨ 新功能</b>
-    • ⚡ 升级穿透 - 同级别过滤，升级立即报警
-    • 🌙 夜间模式 - 自动重复提醒实现紧急唤醒
-    """
         await update.message.reply_text(
-            help_text, 
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            _HELP_TEXT, 
+            reply_markup=_JOIN_GROUP_MARKUP,
             parse_mode=ParseMode.HTML
         )
     
     async def _cmd_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
-        keyboard = self._get_main_menu_keyboard()
+        markup = self._get_main_menu_keyboard()
         pending = self.notifier.get_pending_count(user_config.user_id)
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        local_now, is_night, effective_mode = user_config.time_snapshot()
         
         await update.message.reply_text(
             f"🦅 <b>币哨控制面板</b>\n\n"
@@ -865,97 +1377,84 @@ class TelegramBot:
             f"<b>夜间模式:</b> {'✅' if user_config.alert_mode.night.enabled else '❌'}\n"
             f"<b>时区:</b> {user_config.timezone_name}\n"
             f"<b>待确认:</b> {pending}\n\n"
-            f"⏰ {user_config.get_local_time_str()}",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            f"⏰ {user_config.get_local_time_str(local_now)}",
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     async def _cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
         
-        spot_count = len(self.system.binance.spot_symbols) if self.system else 0
-        futures_count = len(self.system.binance.futures_symbols) if self.system else 0
+        spot_count = futures_count = 0
+        if self.system:
+            binance = self.system.binance
+            spot_count = len(binance.spot_symbols)
+            futures_count = len(binance.futures_symbols)
         pending = self.notifier.get_pending_count(user_config.user_id)
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        local_now, is_night, effective_mode = user_config.time_snapshot()
         
         engine_stats = {}
-        if self.system and hasattr(self.system, 'alert_engine'):
-            engine_stats = self.system.alert_engine.get_stats()
+        if self._alert_engine is not None:
+            engine_stats = self._alert_engine.get_stats()
         
         # 添加用户统计
-        all_users = user_manager.get_all_users()
-        total_users = len(all_users)
-        active_users = len([u for u in all_users if u.is_active])
-        
-        text = f"""
-    📊 <b>系统状态</b>
-    
-    <b>运行状态:</b> ✅ 正常
-    <b>现货:</b> {spot_count} 个
-    <b>合约:</b> {futures_count} 个
-    <b>用户:</b> {total_users} 人 (活跃: {active_users})
-    
-    <b>你的配置:</b>
-    • 时区: {user_config.timezone_name} (UTC{user_config.timezone_offset:+d})
-    • 当前: {"🌙 夜间" if is_night else "☀️ 日间"}
-    • 生效模式: {effective_mode.value}
-    • 夜间模式: {'✅' if user_config.alert_mode.night.enabled else '❌'}
-    • 监控: {user_config.watch_mode}
-    • 白名单: {len(user_config.whitelist)} 个
-    • 黑名单: {len(user_config.blacklist)} 个
-    • 待确认: {pending} 个
-    
-    ⏰ {user_config.get_local_time_str()}
-    """
+        total_users, active_users = user_manager.get_user_counts()
+        
+        text = _STATUS_TEMPLATE.format_map({
+            'spot_count': spot_count,
+            'futures_count': futures_count,
+            'total_users': total_users,
+            'active_users': active_users,
+            'timezone_name': user_config.timezone_name,
+            'timezone_offset': user_config.timezone_offset,
+            'day_night': "🌙 夜间" if is_night else "☀️ 日间",
+            'effective_mode': effective_mode.value,
+            'night_enabled': '✅' if user_config.alert_mode.night.enabled else '❌',
+            'watch_mode': user_config.watch_mode,
+            'whitelist_count': len(user_config.whitelist),
+            'blacklist_count': len(user_config.blacklist),
+            'pending': pending,
+            'local_time': user_config.get_local_time_str(local_now),
+        })
         await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _cmd_config(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
         channels = [c.value for c in user_config.notify_channels]
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        local_now, is_night, effective_mode = user_config.time_snapshot()
         night = user_config.alert_mode.night
         
-        text = f"""
-⚙️ <b>当前配置</b>
-
-<b>🌍 时区:</b> {user_config.timezone_name} (UTC{user_config.timezone_offset:+d})
-
-<b>🎯 灵敏度:</b> {user_config.profile.value}
-• 1分钟: ±{user_config.price.short_1m_pump}%
-• 5分钟: ±{user_config.price.mid_5m_pump}%
-• 冷却: {user_config.cooldown_seconds}秒
-
-<b>👁️ 监控:</b> {user_config.watch_mode}
-• 白名单: {len(user_config.whitelist)} 个
-• 黑名单: {len(user_config.blacklist)} 个
-
-<b>🔔 报警模式:</b>
-• 日间模式: {user_config.alert_mode.mode.value}
-• 夜间模式: {'✅ 已开启' if night.enabled else '❌ 未开启'}
-• 当前生效: {effective_mode.value} {'🌙' if is_night else '☀️'}
-
-<b>🌙 夜间配置:</b>
-• 时段: {night.night_start} - {night.night_end}
-• 间隔: {night.night_interval_seconds}秒
-• 重复: {night.night_max_repeats}次
-• 加邮件: {'✅' if night.night_add_email else '❌'}
-
-<b>📧 通知:</b>
-• 邮件: {"✅" if user_config.email.enabled else "❌"}
-• 渠道: {channels}
-
-⏰ {user_config.get_local_time_str()}
-"""
+        text = _CONFIG_TEMPLATE.format_map({
+            'timezone_name': user_config.timezone_name,
+            'timezone_offset': user_config.timezone_offset,
+            'profile': user_config.profile.value,
+            'pump_1m': user_config.price.short_1m_pump,
+            'pump_5m': user_config.price.mid_5m_pump,
+            'cooldown': user_config.cooldown_seconds,
+            'watch_mode': user_config.watch_mode,
+            'whitelist_count': len(user_config.whitelist),
+            'blacklist_count': len(user_config.blacklist),
+            'day_mode': user_config.alert_mode.mode.value,
+            'night_enabled': '✅ 已开启' if night.enabled else '❌ 未开启',
+            'effective_mode': effective_mode.value,
+            'night_icon': '🌙' if is_night else '☀️',
+            'night_start': night.night_start,
+            'night_end': night.night_end,
+            'night_interval': night.night_interval_seconds,
+            'night_repeats': night.night_max_repeats,
+            'night_email': '✅' if night.night_add_email else '❌',
+            'email_enabled': "✅" if user_config.email.enabled else "❌",
+            'channels': channels,
+            'local_time': user_config.get_local_time_str(local_now),
+        })
         await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _cmd_watch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
-        keyboard = self._get_watch_keyboard(user_config)
+        markup = self._get_watch_keyboard(user_config)
         await update.message.reply_text(
             self._get_watch_text(user_config),
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
@@ -1006,22 +1505,18 @@ class TelegramBot:
         symbols = self._parse_symbols(args[1:])
         
         if action == 'add' and symbols:
-            # 使用统一的静音方法（永久静音）
-            for symbol in symbols:
-                user_manager.add_to_blacklist(user_config.user_id, [symbol])
-                # 也要移除待处理报警
-                self.notifier.remove_alerts_for_symbol(user_config.user_id, symbol)
+            # 一次写入黑名单，一次遍历移除待处理报警
+            user_manager.add_to_blacklist(user_config.user_id, symbols)
+            self.notifier.remove_alerts_for_symbols(user_config.user_id, symbols)
             await update.message.reply_text(f"✅ 已添加到黑名单: {', '.join(symbols)}")
         elif action in ('del', 'remove', 'rm') and symbols:
             user_manager.remove_from_blacklist(user_config.user_id, symbols)
             # 清除临时静音记录
-            for symbol in symbols:
-                if user_config.user_id in self.muted_symbols:
-                    self.muted_symbols[user_config.user_id].pop(symbol, None)
+            self._cancel_mute_timers(user_config.user_id, symbols)
             await update.message.reply_text(f"✅ 已移除: {', '.join(symbols)}")
         elif action == 'clear':
             user_manager.update_user(user_config.user_id, blacklist=[])
-            self.muted_symbols.pop(user_config.user_id, None)
+            self._cancel_user_mute_timers(user_config.user_id)
             await update.message.reply_text("✅ 黑名单已清空")
         else:
             await update.message.reply_text(
@@ -1034,19 +1529,19 @@ class TelegramBot:
     
     async def _cmd_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
-        keyboard = self._get_profile_keyboard(user_config)
+        markup = self._get_profile_keyboard(user_config)
         await update.message.reply_text(
             self._get_profile_text(user_config),
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     async def _cmd_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
-        keyboard = self._get_mode_keyboard(user_config)
+        markup = self._get_mode_keyboard(user_config)
         await update.message.reply_text(
             self._get_mode_text(user_config),
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
@@ -1058,18 +1553,13 @@ class TelegramBot:
             action = args[0].lower()
             
             if action == "on":
-                user_config.email.enabled = True
-                if NotifyChannel.EMAIL not in user_config.notify_channels:
-                    user_config.notify_channels.append(NotifyChannel.EMAIL)
-                user_manager._save()
+                # 已启用时不重复写盘
+                user_manager.enable_email(user_config.user_id)
                 await update.message.reply_text("✅ 邮件通知已启用")
                 return
             
             elif action == "off":
-                user_config.email.enabled = False
-                if NotifyChannel.EMAIL in user_config.notify_channels:
-                    user_config.notify_channels.remove(NotifyChannel.EMAIL)
-                user_manager._save()
+                user_manager.disable_email(user_config.user_id)
                 await update.message.reply_text("✅ 邮件通知已禁用")
                 return
             
@@ -1079,14 +1569,16 @@ class TelegramBot:
                 user_config.email.enabled = True
                 if NotifyChannel.EMAIL not in user_config.notify_channels:
                     user_config.notify_channels.append(NotifyChannel.EMAIL)
-                user_manager._save()
+                user_manager.mark_dirty(user_config.user_id)
+                # 邮箱地址确认落盘后再回复
+                await user_manager.flush()
                 await update.message.reply_text(
                     f"✅ 邮箱已设置: {email_addr}\n"
                     f"✅ 邮件通知已启用"
                 )
                 return
         
-        keyboard = self._get_email_keyboard(user_config)
+        markup = self._get_email_keyboard(user_config)
         emails = ', '.join(user_config.email.to_addresses) or '未设置'
         channels = [c.value for c in user_config.notify_channels]
         
@@ -1099,32 +1591,36 @@ class TelegramBot:
             f"<code>/email on</code> - 启用\n"
             f"<code>/email off</code> - 禁用\n"
             f"<code>/email xxx@email.com</code> - 设置邮箱",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     async def _cmd_test(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        from models import Alert, AlertType, AlertLevel, MarketType
-        
         user_config = self._get_user(update)
         
         btc_info = None
         if self.system:
             btc_info = self.system.binance.get_token_info("BTCUSDT", MarketType.SPOT)
         
+        # 无行情时直接用默认数据，只判断一次
+        if btc_info is None:
+            data = dict(_TEST_ALERT_DATA)
+        else:
+            data = {
+                'price': btc_info.price,
+                'change_percent': 5.0,
+                'high_24h': btc_info.high_24h,
+                'low_24h': btc_info.low_24h,
+                'volume_24h': btc_info.quote_volume_24h,
+            }
+        
         alert = Alert(
             alert_type=AlertType.PRICE_PUMP,
             level=AlertLevel.WARNING,
             symbol="BTCUSDT",
             market_type=MarketType.SPOT,
             message="测试报警 - 5分钟涨幅 5.00%",
-            data={
-                'price': btc_info.price if btc_info else 50000,
-                'change_percent': 5.0,
-                'high_24h': btc_info.high_24h if btc_info else 51000,
-                'low_24h': btc_info.low_24h if btc_info else 49000,
-                'volume_24h': btc_info.quote_volume_24h if btc_info else 1000000000,
-            }
+            data=data
         )
         
         await self.notifier.send_alert_to_user(alert, user_config)
@@ -1159,18 +1655,17 @@ class TelegramBot:
             # 解析金额
             try:
                 value = self._parse_volume_value(arg)
-                if value > 0:
-                    user_manager.set_volume_filter(user_config.user_id, True, value)
-                    user_config = user_manager.get_user(user_config.user_id)
-                    await update.message.reply_text(
-                        f"✅ 成交额筛选已设置\n\n"
-                        f"最低24h成交额: <b>{user_config.get_volume_filter_display()}</b>\n\n"
-                        f"💡 只有成交额达标的代币才会触发报警",
-                        parse_mode=ParseMode.HTML
-                    )
-                    return
-            except:
-                pass
+            except ValueError:
+                value = 0
+            if value > 0:
+                user_config = user_manager.set_volume_filter(user_config.user_id, True, value)
+                await update.message.reply_text(
+                    f"✅ 成交额筛选已设置\n\n"
+                    f"最低24h成交额: <b>{user_config.get_volume_filter_display()}</b>\n\n"
+                    f"💡 只有成交额达标的代币才会触发报警",
+                    parse_mode=ParseMode.HTML
+                )
+                return
             
             await update.message.reply_text(
                 "❌ 无效的金额格式\n\n"
@@ -1185,7 +1680,7 @@ class TelegramBot:
             return
         
         # 显示当前设置和选项菜单
-        keyboard = self._get_volume_filter_keyboard(user_config)
+        markup = self._get_volume_filter_keyboard(user_config)
         
         await update.message.reply_text(
             f"💎 <b>24H成交额筛选</b>\n\n"
@@ -1197,74 +1692,23 @@ class TelegramBot:
             f"<code>/minvol 10M</code> - 1000万USDT\n"
             f"<code>/minvol 100M</code> - 1亿USDT\n"
             f"<code>/minvol off</code> - 关闭筛选",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     def _parse_volume_value(self, text: str) -> float:
         """解析成交额值，支持 K/M/B 后缀"""
-        text = text.upper().strip()
-        
-        multipliers = {
-            'K': 1_000,
-            'M': 1_000_000,
-            'B': 1_000_000_000,
-        }
-        
-        for suffix, mult in multipliers.items():
-            if text.endswith(suffix):
-                return float(text[:-1]) * mult
-        
+        m = _VOLUME_VALUE_RE.fullmatch(text)
+        if m:
+            return float(m.group(1)) * _VOLUME_MULTIPLIERS[m.group(2).upper()]
+        # 其余写法 (如 1e7) 交给 float，非法输入抛 ValueError
         return float(text)
     
-    def _get_volume_filter_keyboard(self, user_config):
+    def _get_volume_filter_keyboard(self, user_config) -> InlineKeyboardMarkup:
         """成交额筛选键盘"""
-        current = user_config.min_volume_24h
         enabled = user_config.volume_filter_enabled
-        
-        def check(val):
-            return "✅ " if enabled and abs(current - val) < val * 0.01 else ""
-        
-        return [
-            # 开关按钮
-            [InlineKeyboardButton(
-                f"{'🔴 关闭筛选' if enabled else '🟢 开启筛选'}",
-                callback_data="toggle_volume_filter"
-            )],
-            # 常用档位 - 小额
-            [
-                InlineKeyboardButton(f"{check(1_000_000)}$1M", callback_data="minvol_1000000"),
-                InlineKeyboardButton(f"{check(5_000_000)}$5M", callback_data="minvol_5000000"),
-                InlineKeyboardButton(f"{check(10_000_000)}$10M", callback_data="minvol_10000000"),
-            ],
-            # 常用档位 - 中额
-            [
-                InlineKeyboardButton(f"{check(50_000_000)}$50M", callback_data="minvol_50000000"),
-                InlineKeyboardButton(f"{check(100_000_000)}$100M", callback_data="minvol_100000000"),
-                InlineKeyboardButton(f"{check(500_000_000)}$500M", callback_data="minvol_500000000"),
-            ],
-            # 常用档位 - 大额
-            [
-                InlineKeyboardButton(f"{check(1_000_000_000)}$1B", callback_data="minvol_1000000000"),
-                InlineKeyboardButton(f"{check(5_000_000_000)}$5B", callback_data="minvol_5000000000"),
-            ],
-            [InlineKeyboardButton("◀️ 返回监控类型", callback_data="menu_switches")],
-        ]
-    
-    async def _show_volume_filter_menu(self, message, user_config):
-        """显示成交额筛选菜单"""
-        keyboard = self._get_volume_filter_keyboard(user_config)
-        
-        await message.edit_text(
-            f"💎 <b>24H成交额筛选</b>\n\n"
-            f"<b>当前状态:</b> {'✅ 已开启' if user_config.volume_filter_enabled else '❌ 未开启'}\n"
-            f"<b>最低成交额:</b> {user_config.get_volume_filter_display()}\n\n"
-            f"💡 开启后，只有24小时成交额达到设定值的代币才会触发报警\n"
-            f"适合过滤小币种，专注主流币\n\n"
-            f"命令设置: <code>/minvol 10M</code>",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
-        )
+        selected = _volume_tier_index(user_config.min_volume_24h) if enabled else -1
+        return _build_volume_filter_markup(enabled, selected)
     
     # ================== 管理员命令 ==================
     async def _cmd_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1273,16 +1717,15 @@ class TelegramBot:
             await update.message.reply_text("❌ 无权限")
             return
         
-        users = user_manager.get_all_users()
-        active = len([u for u in users if u.is_active])
+        total, active = user_manager.get_user_counts()
         
         engine_stats = {}
-        if self.system and hasattr(self.system, 'alert_engine'):
-            engine_stats = self.system.alert_engine.get_stats()
+        if self._alert_engine is not None:
+            engine_stats = self._alert_engine.get_stats()
         
         await update.message.reply_text(
             f"👑 <b>管理员面板</b>\n\n"
-            f"<b>用户:</b> {len(users)} (活跃: {active})\n\n"
+            f"<b>用户:</b> {total} (活跃: {active})\n\n"
             f"<b>报警统计:</b>\n"
             f"• 总报警: {engine_stats.get('total_alerts', 0)}\n"
             f"• ⚡ 升级穿透: {engine_stats.get('escalation_count', 0)}\n"
@@ -1298,20 +1741,24 @@ class TelegramBot:
             await update.message.reply_text("❌ 无权限")
             return
         
-        users = user_manager.get_all_users()
-        text = "👥 <b>用户列表</b>\n\n"
+        users = user_manager.list_users(limit=20)
+        total = user_manager.count()
+        parts = ["👥 <b>用户列表</b>\n\n"]
+        append = parts.append
+        tz_strs = _TZ_STRS
         
-        for u in users[:20]:
+        for u in users:
             status = "✅" if u.is_active else "❌"
             admin = "👑" if u.is_admin else ""
-            tz = f"UTC{u.timezone_offset:+d}"
+            offset = u.timezone_offset
+            tz = tz_strs.get(offset) or f"UTC{offset:+d}"
             night = "🌙" if u.alert_mode.night.enabled else ""
-            text += f"{status}{admin}{night} {u.username or u.user_id[:8]} ({tz})\n"
+            append(f"{status}{admin}{night} {u.username or u.user_id[:8]} ({tz})\n")
         
-        if len(users) > 20:
-            text += f"\n... 共 {len(users)} 个"
+        if total > 20:
+            append(f"\n... 共 {total} 个")
         
-        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+        await update.message.reply_text("".join(parts), parse_mode=ParseMode.HTML)
     
     async def _cmd_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_config = self._get_user(update)
@@ -1324,502 +1771,447 @@ class TelegramBot:
             await update.message.reply_text("用法: /broadcast <消息>")
             return
         
-        await self.notifier.broadcast(f"📢 <b>系统公告</b>\n\n{message}")
-        await update.message.reply_text("✅ 广播已发送")
+        queued, dropped = await self.notifier.broadcast(f"📢 <b>系统公告</b>\n\n{message}")
+        text = f"✅ 广播已加入发送队列: {queued} 人"
+        if dropped:
+            text += f"\n⚠️ 通知系统已停止，未入队: {dropped} 人"
+        await update.message.reply_text(text)
     
     # ================== 回调处理 ==================
     async def _handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         
-        user_config = self._get_user(update)
-        data = query.data
-        message = query.message
-        
+        # 先回应callback，按钮转圈立即消失；实际处理放到后台任务
         try:
-            # 先回应callback，避免超时（只调用一次）
             await query.answer()
+        except BadRequest as e:
+            logger.debug(f"回调应答失败 (可能已过期): {e}")
+            return
+        
+        task = asyncio.create_task(self._dispatch_callback(update))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+    
+    async def _dispatch_callback(self, update: Update):
+        """后台处理回调 (查询数据、编辑消息)"""
+        # 后台任务里的异常没人 await，全部放进 try 交给下面的分支记录
+        data = message = None
+        try:
+            query = update.callback_query
+            data = query.data
+            message = query.message
+            user_config = self._get_user(update)
             
-            # ========== 确认报警 ==========
-            if data.startswith("confirm_alert_"):
-                alert_id = data.replace("confirm_alert_", "")
-                if self.notifier.confirm_alert(user_config.user_id, alert_id):
-                    pending = self.notifier.get_pending_count(user_config.user_id)
-                    await query.edit_message_text(
-                        f"✅ <b>报警已确认</b>\n\n"
-                        f"报警ID: <code>{alert_id}</code>\n"
-                        f"确认时间: {user_config.get_local_time_str()}\n\n"
-                        f"📋 剩余待确认: {pending} 个",
-                        parse_mode=ParseMode.HTML
-                    )
-                return
-            
-            if data == "confirm_all_alerts":
-                count = self.notifier.confirm_all_alerts(user_config.user_id)
-                await query.edit_message_text(
-                    f"✅ <b>已确认全部报警</b>\n\n"
-                    f"确认数量: {count} 个\n"
-                    f"时间: {user_config.get_local_time_str()}",
-                    parse_mode=ParseMode.HTML
-                )
-                return
-            
-            # ========== 成交额筛选 ==========
-            if data == "toggle_volume_filter":
-                user_config.volume_filter_enabled = not user_config.volume_filter_enabled
-                user_manager._save()
-                user_config = user_manager.get_user(user_config.user_id)
-                # 返回成交额筛选菜单
-                await self._show_volume_filter_menu(message, user_config)
-                return
-            
-            if data.startswith("minvol_"):
-                value = float(data.replace("minvol_", ""))
-                user_manager.set_volume_filter(user_config.user_id, True, value)
-                user_config = user_manager.get_user(user_config.user_id)
-                # 返回成交额筛选菜单
-                await self._show_volume_filter_menu(message, user_config)
-                return
+            # 先完整匹配，再按第一个前缀分发
+            handler = self._cb_exact.get(data) or self._cb_routes.get(data.partition('_')[0])
+            if handler:
+                await handler(query, message, user_config, data)
             
-            if data == "menu_volume_filter":
-                await self._show_volume_filter_menu(message, user_config)
+        except BadRequest as e:
+            error_msg = str(e)
+            if "Message is not modified" in error_msg:
+                logger.debug(f"消息未变化，忽略: {data}")
+            elif "message to edit not found" in error_msg.lower():
+                logger.debug(f"消息已删除: {data}")
+            else:
+                logger.error(f"回调处理错误 (BadRequest): {e}")
+                
+        except Exception as e:
+            # logger.exception 自带堆栈，无需 traceback 模块
+            logger.exception(f"回调处理错误: {e}")
+            # 回调已应答过，改为回复消息提示
+            if message is None:
                 return
+            try:
+                await message.reply_text("❌ 操作失败")
+            except TelegramError as reply_err:
+                logger.debug(f"失败提示发送失败: {reply_err}")
+    
+    async def _cb_noop(self, query, message, user_config, data):
+        """分隔行按钮，无操作"""
+    
+    async def _cb_confirm(self, query, message, user_config, data):
+        """确认单条报警回调"""
+        # confirm_alert_<id>
+        _, action, alert_id = data.split("_", 2)
+        if action != "alert":
+            return
+        if self.notifier.confirm_alert(user_config.user_id, alert_id):
+            pending = self.notifier.get_pending_count(user_config.user_id)
+            await query.edit_message_text(
+                f"✅ <b>报警已确认</b>\n\n"
+                f"报警ID: <code>{alert_id}</code>\n"
+                f"确认时间: {user_config.get_local_time_str()}\n\n"
+                f"📋 剩余待确认: {pending} 个",
+                parse_mode=ParseMode.HTML
+            )
+    
+    async def _cb_confirm_all(self, query, message, user_config, data):
+        """确认全部报警回调"""
+        count = self.notifier.confirm_all_alerts(user_config.user_id)
+        await query.edit_message_text(
+            f"✅ <b>已确认全部报警</b>\n\n"
+            f"确认数量: {count} 个\n"
+            f"时间: {user_config.get_local_time_str()}",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def _cb_toggle_volume_filter(self, query, message, user_config, data):
+        """成交额筛选开关"""
+        user_config.volume_filter_enabled = not user_config.volume_filter_enabled
+        user_manager.mark_dirty(user_config.user_id)
+        # 返回成交额筛选菜单
+        await self._show_volume_filter_menu(message, user_config)
+    
+    async def _cb_toggle_night(self, query, message, user_config, data):
+        """夜间模式开关"""
+        night = user_config.alert_mode.night
+        user_config = user_manager.set_night_mode(user_config.user_id, not night.enabled)
+        status = "开启" if user_config.alert_mode.night.enabled else "关闭"
+        await query.edit_message_text(
+            f"✅ 夜间模式已{status}\n\n"
+            f"💡 夜间时段 ({user_config.alert_mode.night.night_start}-{user_config.alert_mode.night.night_end}) "
+            f"将自动使用重复提醒模式",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def _cb_toggle_night_email(self, query, message, user_config, data):
+        """夜间自动加邮件开关"""
+        user_config.alert_mode.night.night_add_email = not user_config.alert_mode.night.night_add_email
+        user_manager.mark_dirty(user_config.user_id)
+        status = "开启" if user_config.alert_mode.night.night_add_email else "关闭"
+        await query.edit_message_text(f"✅ 夜间自动加邮件: {status}")
+    
+    async def _cb_toggle_email(self, query, message, user_config, data):
+        """邮件通知开关"""
+        user_config.email.enabled = not user_config.email.enabled
+        if user_config.email.enabled:
+            if NotifyChannel.EMAIL not in user_config.notify_channels:
+                user_config.notify_channels.append(NotifyChannel.EMAIL)
+        else:
+            if NotifyChannel.EMAIL in user_config.notify_channels:
+                user_config.notify_channels.remove(NotifyChannel.EMAIL)
+        user_manager.mark_dirty(user_config.user_id)
+        status = "开启" if user_config.email.enabled else "关闭"
+        await query.edit_message_text(f"✅ 邮件通知已{status}")
+    
+    async def _cb_minvol(self, query, message, user_config, data):
+        """成交额档位回调"""
+        m = _MINVOL_CB_RE.fullmatch(data)
+        if m:
+            value = float(m['value'])
+            user_config = user_manager.set_volume_filter(user_config.user_id, True, value)
+            # 返回成交额筛选菜单
+            await self._show_volume_filter_menu(message, user_config)
+    
+    async def _cb_menu_volume_filter(self, query, message, user_config, data):
+        """成交额筛选菜单"""
+        await self._show_volume_filter_menu(message, user_config)
+    
+    async def _cb_mute(self, query, message, user_config, data):
+        """静音代币回调"""
+        # ========== 静音代币 ==========
+        m = _MUTE_CB_RE.fullmatch(data)
+        if m and m['action'] == "mute_symbol":
+            # 标准化symbol
+            symbol = _norm(m['sym'])
+            minutes = int(m['mins'] or 60)
+            name = _strip_usdt(symbol)
             
-            # ========== 静音代币 ==========
-            if data.startswith("mute_symbol_"):
-                parts = data.replace("mute_symbol_", "").rsplit("_", 1)
-                symbol = parts[0]
-                minutes = int(parts[1]) if len(parts) > 1 else 60
-                name = symbol.replace('USDT', '')
-                
-                # 刷新用户配置
-                user_config = user_manager.get_user(user_config.user_id)
+            # 检查是否已经静音
+            if symbol in user_config.blacklist:
+                # 已经静音 - 显示当前状态和取消选项
+                remaining = self._get_mute_remaining(user_config.user_id, symbol)
+                markup = _build_mute_action_markup(symbol)
                 
-                # 标准化symbol
-                if not symbol.endswith('USDT'):
-                    symbol += 'USDT'
-                
-                # 检查是否已经静音
-                if symbol in user_config.blacklist:
-                    # 已经静音 - 显示当前状态和取消选项
-                    unmute_time = None
-                    if user_config.user_id in self.muted_symbols:
-                        unmute_time = self.muted_symbols[user_config.user_id].get(symbol)
+                if remaining:
+                    remaining_hours, rest = divmod(int(remaining), 3600)
+                    remaining_min = rest // 60
+                    if remaining_hours > 0:
+                        time_str = f"{remaining_hours}小时{remaining_min}分钟"
+                    else:
+                        time_str = f"{remaining_min}分钟"
                     
-                    keyboard = [
-                        [InlineKeyboardButton("🔊 取消静音", callback_data=f"unmute_symbol_{symbol}")],
-                        [
-                            InlineKeyboardButton("⏰ +1小时", callback_data=f"extend_mute_{symbol}_60"),
-                            InlineKeyboardButton("⏰ +24小时", callback_data=f"extend_mute_{symbol}_1440"),
-                        ],
-                        [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-                    ]
+                    # 转换为用户时区
+                    unmute_time = datetime.now(timezone.utc) + timedelta(seconds=remaining)
+                    unmute_time_local = user_config.get_local_time(unmute_time)
                     
-                    if unmute_time and unmute_time > datetime.now():
-                        remaining = (unmute_time - datetime.now()).total_seconds()
-                        remaining_hours = int(remaining / 3600)
-                        remaining_min = int((remaining % 3600) / 60)
-                        if remaining_hours > 0:
-                            time_str = f"{remaining_hours}小时{remaining_min}分钟"
-                        else:
-                            time_str = f"{remaining_min}分钟"
-                        
-                        # 转换为用户时区
-                        unmute_time_local = user_config.get_local_time(unmute_time)
-                        
-                        await query.edit_message_text(
-                            f"🔇 <b>{name} 已在静音中</b>\n\n"
-                            f"⏰ 剩余时间: <b>{time_str}</b>\n"
-                            f"解除时间: {unmute_time_local.strftime('%H:%M:%S')}\n\n"
-                            f"💡 静音期间不会收到该代币的任何报警",
-                            reply_markup=InlineKeyboardMarkup(keyboard),
-                            parse_mode=ParseMode.HTML
-                        )
-                    else:
-                        # 永久黑名单（非临时静音）
-                        await query.edit_message_text(
-                            f"🔇 <b>{name} 已在黑名单中</b>\n\n"
-                            f"该代币不会收到任何报警\n\n"
-                            f"💡 点击下方按钮取消静音\n"
-                            f"或使用: /blacklist del {name}",
-                            reply_markup=InlineKeyboardMarkup(keyboard),
-                            parse_mode=ParseMode.HTML
-                        )
-                    return
-                
-                # 执行静音 - 使用统一方法
-                removed_count = self._mute_symbol_for_user(user_config.user_id, symbol, minutes)
-                unmute_time = self.muted_symbols[user_config.user_id][symbol]
-                
-                # 转换为用户时区
-                unmute_time_local = user_config.get_local_time(unmute_time)
-                
-                # 格式化时长显示
-                if minutes >= 60:
-                    duration_str = f"{minutes // 60} 小时"
-                    if minutes % 60 > 0:
-                        duration_str += f" {minutes % 60} 分钟"
-                else:
-                    duration_str = f"{minutes} 分钟"
-                
-                keyboard = [
-                    [InlineKeyboardButton("🔊 立即取消静音", callback_data=f"unmute_symbol_{symbol}")],
-                    [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-                ]
-                
-                removed_text = f"\n✅ 已停止 {removed_count} 个待处理提醒" if removed_count > 0 else ""
-                
-                await query.edit_message_text(
-                    f"🔇 <b>{name} 已静音</b>\n\n"
-                    f"⏰ 时长: {duration_str}\n"
-                    f"解除时间: {unmute_time_local.strftime('%H:%M:%S')}{removed_text}\n\n"
-                    f"• 静音期间不会收到该代币的报警\n"
-                    f"• 到期后自动恢复并通知你",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.HTML
-                )
-                return
-            
-            # ========== 取消静音 ==========
-            if data.startswith("unmute_symbol_"):
-                symbol = data.replace("unmute_symbol_", "")
-                name = symbol.replace('USDT', '')
-                
-                # 使用统一方法取消静音
-                self._unmute_symbol_for_user(user_config.user_id, symbol)
-                
-                keyboard = [[InlineKeyboardButton("◀️ 返回", callback_data="back_menu")]]
-                
-                await query.edit_message_text(
-                    f"🔊 <b>{name} 已取消静音</b>\n\n"
-                    f"✅ 现在会正常接收该代币的报警\n"
-                    f"时间: {user_config.get_local_time_str()}",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.HTML
-                )
-                return
-            
-            # ========== 延长静音 ==========
-            if data.startswith("extend_mute_"):
-                parts = data.replace("extend_mute_", "").rsplit("_", 1)
-                symbol = parts[0]
-                minutes = int(parts[1]) if len(parts) > 1 else 60
-                name = symbol.replace('USDT', '')
-                
-                # 标准化symbol
-                if not symbol.endswith('USDT'):
-                    symbol += 'USDT'
-                
-                # 延长静音时间
-                if user_config.user_id not in self.muted_symbols:
-                    self.muted_symbols[user_config.user_id] = {}
-                
-                current_time = self.muted_symbols[user_config.user_id].get(symbol, datetime.now())
-                if current_time < datetime.now():
-                    current_time = datetime.now()
-                
-                new_unmute_time = current_time + timedelta(minutes=minutes)
-                self.muted_symbols[user_config.user_id][symbol] = new_unmute_time
-                
-                # 确保在黑名单中
-                if symbol not in user_config.blacklist:
-                    user_manager.add_to_blacklist(user_config.user_id, [symbol])
-                
-                # 转换为用户时区
-                new_unmute_time_local = user_config.get_local_time(new_unmute_time)
-                
-                # 格式化延长时间
-                if minutes >= 60:
-                    extend_str = f"+{minutes // 60} 小时"
+                    await query.edit_message_text(
+                        f"🔇 <b>{name} 已在静音中</b>\n\n"
+                        f"⏰ 剩余时间: <b>{time_str}</b>\n"
+                        f"解除时间: {unmute_time_local.strftime('%H:%M:%S')}\n\n"
+                        f"💡 静音期间不会收到该代币的任何报警",
+                        reply_markup=markup,
+                        parse_mode=ParseMode.HTML
+                    )
                 else:
-                    extend_str = f"+{minutes} 分钟"
-                
-                keyboard = [
-                    [InlineKeyboardButton("🔊 取消静音", callback_data=f"unmute_symbol_{symbol}")],
-                    [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-                ]
-                
-                await query.edit_message_text(
-                    f"🔇 <b>{name} 静音已延长</b>\n\n"
-                    f"⏰ 新的解除时间: {new_unmute_time_local.strftime('%H:%M:%S')}\n"
-                    f"延长: {extend_str}",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.HTML
-                )
-                return
-            
-            # ========== 返回主菜单 ==========
-            if data == "back_menu":
-                await self._show_main_menu(message, user_config)
-                return
-            
-            # ========== 时区设置 ==========
-            if data.startswith("tz_"):
-                parts = data.split("_", 2)
-                offset = int(parts[1])
-                name = parts[2] if len(parts) > 2 else f"UTC{offset:+d}"
-                user_manager.set_timezone(user_config.user_id, offset, name)
-                user_config = user_manager.get_user(user_config.user_id)
-                await query.edit_message_text(
-                    f"✅ 时区已设置为 <b>{name}</b>\n\n"
-                    f"当前时间: {user_config.get_local_time_str()}",
-                    parse_mode=ParseMode.HTML
-                )
-                return
-            
-            # ========== 夜间模式 ==========
-            if data == "toggle_night":
-                night = user_config.alert_mode.night
-                user_manager.set_night_mode(user_config.user_id, not night.enabled)
-                user_config = user_manager.get_user(user_config.user_id)
-                status = "开启" if user_config.alert_mode.night.enabled else "关闭"
-                await query.edit_message_text(
-                    f"✅ 夜间模式已{status}\n\n"
-                    f"💡 夜间时段 ({user_config.alert_mode.night.night_start}-{user_config.alert_mode.night.night_end}) "
-                    f"将自动使用重复提醒模式",
-                    parse_mode=ParseMode.HTML
-                )
-                return
-            
-            # 重复模式间隔设置
-            if data.startswith("repeat_interval_"):
-                interval = int(data.replace("repeat_interval_", ""))
-                user_config.alert_mode.repeat.interval_seconds = interval
-                user_manager._save()
-                await query.edit_message_text(f"✅ 重复间隔: {interval} 秒")
-                return
-            
-            # 重复模式次数设置
-            if data.startswith("repeat_max_"):
-                count = int(data.replace("repeat_max_", ""))
-                user_config.alert_mode.repeat.max_repeats = count
-                user_manager._save()
-                await query.edit_message_text(f"✅ 最大重复: {count} 次")
-                return
-            
-            if data.startswith("night_time_"):
-                parts = data.replace("night_time_", "").split("_")
-                if len(parts) == 2:
-                    start = f"{parts[0]}:00"
-                    end = f"{parts[1]}:00"
-                    user_manager.set_night_time(user_config.user_id, start, end)
-                    await query.edit_message_text(f"✅ 夜间时段: {start} - {end}")
-                return
-            
-            if data.startswith("night_interval_"):
-                interval = int(data.replace("night_interval_", ""))
-                user_config.alert_mode.night.night_interval_seconds = interval
-                user_manager._save()
-                await query.edit_message_text(f"✅ 夜间重复间隔: {interval} 秒")
-                return
-            
-            if data.startswith("night_max_"):
-                count = int(data.replace("night_max_", ""))
-                user_config.alert_mode.night.night_max_repeats = count
-                user_manager._save()
-                await query.edit_message_text(f"✅ 夜间最大重复: {count} 次")
-                return
-            
-            if data == "toggle_night_email":
-                user_config.alert_mode.night.night_add_email = not user_config.alert_mode.night.night_add_email
-                user_manager._save()
-                status = "开启" if user_config.alert_mode.night.night_add_email else "关闭"
-                await query.edit_message_text(f"✅ 夜间自动加邮件: {status}")
+                    # 永久黑名单（非临时静音）
+                    await query.edit_message_text(
+                        f"🔇 <b>{name} 已在黑名单中</b>\n\n"
+                        f"该代币不会收到任何报警\n\n"
+                        f"💡 点击下方按钮取消静音\n"
+                        f"或使用: /blacklist del {name}",
+                        reply_markup=markup,
+                        parse_mode=ParseMode.HTML
+                    )
                 return
             
-            # ========== 排行榜 ==========
-            if data.startswith("rank_"):
-                await self._handle_rank_callback(query, message, user_config, data)
-                return
+            # 执行静音 - 使用统一方法
+            removed_count = self._mute_symbol_for_user(user_config.user_id, symbol, minutes)
+            # 时长已知，直接推算解除时间，不再回查静音记录
+            unmute_time = datetime.now(timezone.utc) + timedelta(minutes=minutes)
             
-            # ========== 代币信息刷新 ==========
-            if data.startswith("info_"):
-                symbol = data.replace("info_", "")
-                await self._show_token_info_edit(message, user_config, symbol)
-                return
+            # 转换为用户时区
+            unmute_time_local = user_config.get_local_time(unmute_time)
             
-            # ========== 监控模式 ==========
-            if data.startswith("watch_"):
-                mode = data.replace("watch_", "")
-                user_manager.set_watch_mode(user_config.user_id, mode)
-                await query.edit_message_text(f"✅ 监控模式: <b>{mode}</b>", parse_mode=ParseMode.HTML)
-                return
-            
-            # ========== 灵敏度 ==========
-            if data.startswith("profile_"):
-                profile = AlertProfile(data.replace("profile_", ""))
-                user_manager.set_profile(user_config.user_id, profile)
-                await query.edit_message_text(f"✅ 灵敏度: <b>{profile.value}</b>", parse_mode=ParseMode.HTML)
-                return
+            # 格式化时长显示
+            if minutes >= 60:
+                duration_str = f"{minutes // 60} 小时"
+                if minutes % 60 > 0:
+                    duration_str += f" {minutes % 60} 分钟"
+            else:
+                duration_str = f"{minutes} 分钟"
             
-            # ========== 报警模式 ==========
-            if data.startswith("mode_"):
-                mode = AlertMode(data.replace("mode_", ""))
-                user_manager.set_alert_mode(user_config.user_id, mode)
-                await query.edit_message_text(f"✅ 日间报警模式: <b>{mode.value}</b>", parse_mode=ParseMode.HTML)
-                return
+            removed_text = f"\n✅ 已停止 {removed_count} 个待处理提醒" if removed_count > 0 else ""
             
-            # ========== 邮件 ==========
-            if data == "toggle_email":
-                user_config.email.enabled = not user_config.email.enabled
-                if user_config.email.enabled:
-                    if NotifyChannel.EMAIL not in user_config.notify_channels:
-                        user_config.notify_channels.append(NotifyChannel.EMAIL)
-                else:
-                    if NotifyChannel.EMAIL in user_config.notify_channels:
-                        user_config.notify_channels.remove(NotifyChannel.EMAIL)
-                user_manager._save()
-                status = "开启" if user_config.email.enabled else "关闭"
-                await query.edit_message_text(f"✅ 邮件通知已{status}")
-                return
+            await query.edit_message_text(
+                f"🔇 <b>{name} 已静音</b>\n\n"
+                f"⏰ 时长: {duration_str}\n"
+                f"解除时间: {unmute_time_local.strftime('%H:%M:%S')}{removed_text}\n\n"
+                f"• 静音期间不会收到该代币的报警\n"
+                f"• 到期后自动恢复并通知你",
+                reply_markup=_build_unmute_markup(symbol, "🔊 立即取消静音"),
+                parse_mode=ParseMode.HTML
+            )
+    
+    async def _cb_unmute(self, query, message, user_config, data):
+        """取消静音回调"""
+        # ========== 取消静音 ==========
+        symbol = data[14:]  # unmute_symbol_<symbol>
+        name = _strip_usdt(symbol)
+        
+        # 使用统一方法取消静音
+        self._unmute_symbol_for_user(user_config.user_id, symbol)
+        
+        keyboard = [[InlineKeyboardButton("◀️ 返回", callback_data="back_menu")]]
+        
+        await query.edit_message_text(
+            f"🔊 <b>{name} 已取消静音</b>\n\n"
+            f"✅ 现在会正常接收该代币的报警\n"
+            f"时间: {user_config.get_local_time_str()}",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def _cb_extend(self, query, message, user_config, data):
+        """延长静音回调"""
+        # ========== 延长静音 ==========
+        m = _MUTE_CB_RE.fullmatch(data)
+        if m and m['action'] == "extend_mute":
+            # 标准化symbol
+            symbol = _norm(m['sym'])
+            minutes = int(m['mins'] or 60)
+            name = _strip_usdt(symbol)
             
-            # ========== 开关 ==========
-            if data.startswith("toggle_"):
-                await self._handle_toggle(query, message, user_config, data)
-                return
+            # 延长静音时间 (一次读取、一次写入)
+            total = self._extend_mute_timer(user_config.user_id, symbol, minutes * 60)
+            new_unmute_time = datetime.now(timezone.utc) + timedelta(seconds=total)
             
-            # ========== 清空列表 ==========
-            if data == "clear_whitelist":
-                user_manager.update_user(user_config.user_id, whitelist=[])
-                await query.edit_message_text("✅ 白名单已清空")
-                return
-            if data == "clear_blacklist":
-                user_manager.update_user(user_config.user_id, blacklist=[])
-                self.muted_symbols.pop(user_config.user_id, None)
-                await query.edit_message_text("✅ 黑名单已清空")
-                return
+            # 确保在黑名单中
+            if symbol not in user_config.blacklist:
+                user_manager.add_to_blacklist(user_config.user_id, [symbol])
             
-            # ========== 菜单导航 ==========
-            await self._handle_menu_navigation(query, message, user_config, data)
+            # 转换为用户时区
+            new_unmute_time_local = user_config.get_local_time(new_unmute_time)
             
-        except BadRequest as e:
-            error_msg = str(e)
-            if "Message is not modified" in error_msg:
-                logger.debug(f"消息未变化，忽略: {data}")
-            elif "message to edit not found" in error_msg.lower():
-                logger.debug(f"消息已删除: {data}")
+            # 格式化延长时间
+            if minutes >= 60:
+                extend_str = f"+{minutes // 60} 小时"
             else:
-                logger.error(f"回调处理错误 (BadRequest): {e}")
-                
-        except Exception as e:
-            logger.error(f"回调处理错误: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            try:
-                await query.answer("操作失败", show_alert=True)
-            except:
-                pass
+                extend_str = f"+{minutes} 分钟"
+            
+            await query.edit_message_text(
+                f"🔇 <b>{name} 静音已延长</b>\n\n"
+                f"⏰ 新的解除时间: {new_unmute_time_local.strftime('%H:%M:%S')}\n"
+                f"延长: {extend_str}",
+                reply_markup=_build_unmute_markup(symbol),
+                parse_mode=ParseMode.HTML
+            )
+    
+    async def _cb_back(self, query, message, user_config, data):
+        """返回主菜单回调"""
+        await self._show_main_menu(message, user_config)
+    
+    async def _cb_tz(self, query, message, user_config, data):
+        """时区回调"""
+        # ========== 时区设置 ==========
+        entry = _TZ_CALLBACKS.get(data)
+        if entry:
+            offset, name = entry
+        else:
+            # 预设变更前发出的旧按钮，按原格式解析
+            parts = data.split("_", 2)
+            offset = int(parts[1])
+            name = parts[2] if len(parts) > 2 else f"UTC{offset:+d}"
+        user_config = user_manager.set_timezone(user_config.user_id, offset, name)
+        await query.edit_message_text(
+            f"✅ 时区已设置为 <b>{name}</b>\n\n"
+            f"当前时间: {user_config.get_local_time_str()}",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def _cb_repeat(self, query, message, user_config, data):
+        """重复模式设置回调"""
+        # repeat_<field>_<value>
+        field, value, number = _split_setting_cb(data)
+        
+        # 重复模式间隔设置
+        if field == "interval":
+            interval = number
+            user_config.alert_mode.repeat.interval_seconds = interval
+            user_manager.mark_dirty(user_config.user_id)
+            await query.edit_message_text(f"✅ 重复间隔: {interval} 秒")
+            return
+        
+        # 重复模式次数设置
+        if field == "max":
+            count = number
+            user_config.alert_mode.repeat.max_repeats = count
+            user_manager.mark_dirty(user_config.user_id)
+            await query.edit_message_text(f"✅ 最大重复: {count} 次")
+    
+    async def _cb_night(self, query, message, user_config, data):
+        """夜间模式设置回调"""
+        # night_<field>_<value>
+        field, value, number = _split_setting_cb(data)
+        
+        if field == "time":
+            parts = value.split("_")
+            if len(parts) == 2:
+                start = f"{parts[0]}:00"
+                end = f"{parts[1]}:00"
+                user_manager.set_night_time(user_config.user_id, start, end)
+                await query.edit_message_text(f"✅ 夜间时段: {start} - {end}")
+            return
+        
+        if field == "interval":
+            interval = number
+            user_config.alert_mode.night.night_interval_seconds = interval
+            user_manager.mark_dirty(user_config.user_id)
+            await query.edit_message_text(f"✅ 夜间重复间隔: {interval} 秒")
+            return
+        
+        if field == "max":
+            count = number
+            user_config.alert_mode.night.night_max_repeats = count
+            user_manager.mark_dirty(user_config.user_id)
+            await query.edit_message_text(f"✅ 夜间最大重复: {count} 次")
+    
+    async def _cb_info(self, query, message, user_config, data):
+        """代币信息回调"""
+        # ========== 代币信息刷新 ==========
+        symbol = data[5:]  # info_<symbol>
+        await self._show_token_info_edit(message, user_config, symbol)
+    
+    async def _cb_watch(self, query, message, user_config, data):
+        """监控模式回调"""
+        # ========== 监控模式 ==========
+        mode = data[6:]  # watch_<mode>
+        user_manager.set_watch_mode(user_config.user_id, mode)
+        await query.edit_message_text(f"✅ 监控模式: <b>{mode}</b>", parse_mode=ParseMode.HTML)
+    
+    async def _cb_profile(self, query, message, user_config, data):
+        """灵敏度回调"""
+        # ========== 灵敏度 ==========
+        profile = AlertProfile(data[8:])  # profile_<profile>
+        user_manager.set_profile(user_config.user_id, profile)
+        await query.edit_message_text(f"✅ 灵敏度: <b>{profile.value}</b>", parse_mode=ParseMode.HTML)
+    
+    async def _cb_mode(self, query, message, user_config, data):
+        """报警模式回调"""
+        # ========== 报警模式 ==========
+        mode = AlertMode(data[5:])  # mode_<mode>
+        user_manager.set_alert_mode(user_config.user_id, mode)
+        await query.edit_message_text(f"✅ 日间报警模式: <b>{mode.value}</b>", parse_mode=ParseMode.HTML)
+    
+    async def _cb_clear_whitelist(self, query, message, user_config, data):
+        """清空白名单回调"""
+        user_manager.update_user(user_config.user_id, whitelist=[])
+        await query.edit_message_text("✅ 白名单已清空")
+    
+    async def _cb_clear_blacklist(self, query, message, user_config, data):
+        """清空黑名单回调"""
+        user_manager.update_user(user_config.user_id, blacklist=[])
+        self._cancel_user_mute_timers(user_config.user_id)
+        await query.edit_message_text("✅ 黑名单已清空")
     
     async def _handle_rank_callback(self, query, message, user_config, data):
-        if data == "rank_gainers_spot":
-            await self._show_gainers(message, user_config, MarketType.SPOT, edit=True)
-        elif data == "rank_gainers_futures":
-            await self._show_gainers(message, user_config, MarketType.FUTURES, edit=True)
-        elif data == "rank_losers_spot":
-            await self._show_losers(message, user_config, MarketType.SPOT, edit=True)
-        elif data == "rank_losers_futures":
-            await self._show_losers(message, user_config, MarketType.FUTURES, edit=True)
-        elif data == "rank_volume_spot":
-            await self._show_volume_rank(message, user_config, MarketType.SPOT, edit=True)
-        elif data == "rank_volume_futures":
-            await self._show_volume_rank(message, user_config, MarketType.FUTURES, edit=True)
-        elif data == "rank_spread":
-            await self._show_spread_rank(message, user_config, edit=True)
-        elif data == "rank_funding_pos":
-            await self._show_funding_rank(message, user_config, positive=True, edit=True)
-        elif data == "rank_funding_neg":
-            await self._show_funding_rank(message, user_config, positive=False, edit=True)
-        elif data == "noop":
-            # 分隔线按钮，不做任何操作
-            pass
+        show = self._rank_routes.get(data)
+        if show:
+            await show(message, user_config)
     
     async def _handle_toggle(self, query, message, user_config, data):
-        toggles = {
-            "toggle_spot": ("enable_spot", "现货报警"),
-            "toggle_futures": ("enable_futures", "合约报警"),
-            "toggle_spread": ("enable_spread", "差价报警"),
-            "toggle_volume": ("enable_volume", "成交量报警"),
-            "toggle_funding": ("enable_funding", "资金费率报警"),
-            "toggle_big_order": ("enable_big_order", "巨量挂单报警"),  # 新增
-        }
-        
-        if data in toggles:
-            attr, name = toggles[data]
-            current = getattr(user_config, attr)
-            setattr(user_config, attr, not current)
-            user_manager._save()
-            user_config = user_manager.get_user(user_config.user_id)
-            await self._show_switches_menu(message, user_config)
+        attr = _TOGGLE_MAP.get(data)
+        if attr is not None:
+            setattr(user_config, attr, not getattr(user_config, attr))
+            user_manager.mark_dirty(user_config.user_id)
+            # 连续点击只按最终状态重绘一次
+            self._schedule_edit(message, functools.partial(self._show_switches_menu, message, user_config))
     
     async def _handle_menu_navigation(self, query, message, user_config, data):
-        if data == "menu_watch":
-            await self._show_watch_menu(message, user_config)
-        elif data == "menu_profile":
-            await self._show_profile_menu(message, user_config)
-        elif data == "menu_mode":
-            await self._show_mode_menu(message, user_config)
-        elif data == "menu_night":
-            await self._show_night_menu(message, user_config)
-        elif data == "menu_email":
-            await self._show_email_menu(message, user_config)
-        elif data == "menu_switches":
-            await self._show_switches_menu(message, user_config)
-        elif data == "menu_timezone":
-            await self._show_timezone_menu(message, user_config)
-        elif data == "menu_whitelist":
-            await self._show_list_menu(message, user_config, "whitelist")
-        elif data == "menu_blacklist":
-            await self._show_list_menu(message, user_config, "blacklist")
-        elif data == "menu_rank":
-            await self._show_rank_menu(message, user_config)
-        elif data == "menu_pending":
-            await self._show_pending_menu(message, user_config)
+        show = self._menu_routes.get(data)
+        if show:
+            await show(message, user_config)
     
     async def _show_token_info_edit(self, message, user_config, symbol):
         if not self.system:
             return
         
-        spot_info = self.system.binance.get_token_info(symbol, MarketType.SPOT)
-        futures_info = self.system.binance.get_token_info(symbol, MarketType.FUTURES)
+        # 两次都是内存行情字典查找，直接同步读取
+        binance = self.system.binance
+        spot_info = binance.get_token_info(symbol, MarketType.SPOT)
+        futures_info = binance.get_token_info(symbol, MarketType.FUTURES)
         
         if not spot_info and not futures_info:
             await message.edit_text(f"❌ 未找到: {symbol}")
             return
         
-        name = symbol.replace('USDT', '')
-        text = f"💎 <b>{name} / USDT</b>\n\n"
+        fp = _format_price
+        parts = [f"💎 <b>{symbol[:-4]} / USDT</b>\n\n"]
+        append = parts.append
         
         if spot_info:
             change_emoji = "📈" if spot_info.price_change_percent_24h > 0 else "📉"
-            text += f"<b>📈 现货</b>\n"
-            text += f"价格: {self._format_price(spot_info.price)}\n"
-            text += f"24h: {change_emoji} {spot_info.price_change_percent_24h:+.2f}%\n"
-            text += f"最高: {self._format_price(spot_info.high_24h)}\n"
-            text += f"最低: {self._format_price(spot_info.low_24h)}\n"
-            text += f"成交额: {spot_info.volume_display}\n\n"
+            append(f"<b>📈 现货</b>\n")
+            append(f"价格: {fp(spot_info.price)}\n")
+            append(f"24h: {change_emoji} {spot_info.price_change_percent_24h:+.2f}%\n")
+            append(f"最高: {fp(spot_info.high_24h)}\n")
+            append(f"最低: {fp(spot_info.low_24h)}\n")
+            append(f"成交额: {spot_info.volume_display}\n\n")
         
         if futures_info:
-            funding = self.system.binance.funding_rates.get(symbol, 0)
-            text += f"<b>📊 合约</b>\n"
-            text += f"价格: {self._format_price(futures_info.price)}\n"
-            text += f"费率: {funding:+.4f}%\n"
+            funding = binance.funding_rates.get(symbol, 0)
+            append(f"<b>📊 合约</b>\n")
+            append(f"价格: {fp(futures_info.price)}\n")
+            append(f"费率: {funding:+.4f}%\n")
             
             if spot_info:
                 spread = ((futures_info.price - spot_info.price) / spot_info.price) * 100
-                text += f"差价: {spread:+.2f}%\n"
+                append(f"差价: {spread:+.2f}%\n")
         
-        text += f"\n⏰ {user_config.get_local_time_str()}"
+        append(f"\n⏰ {user_config.get_local_time_str()}")
+        text = "".join(parts)
         
-        keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data=f"info_{symbol}")]]
+        markup = _refresh_markup(f"info_{symbol}")
         
-        await message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML)
+        await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     # ================== 菜单显示 ==================
     
     async def _show_main_menu(self, message, user_config):
-        keyboard = self._get_main_menu_keyboard()
+        markup = self._get_main_menu_keyboard()
         pending = self.notifier.get_pending_count(user_config.user_id)
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        local_now, is_night, effective_mode = user_config.time_snapshot()
         
         await message.edit_text(
             f"🦅 <b>币哨控制面板</b>\n\n"
@@ -1829,39 +2221,26 @@ class TelegramBot:
             f"<b>夜间模式:</b> {'✅' if user_config.alert_mode.night.enabled else '❌'}\n"
             f"<b>时区:</b> {user_config.timezone_name}\n"
             f"<b>待确认:</b> {pending}\n\n"
-            f"⏰ {user_config.get_local_time_str()}",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            f"⏰ {user_config.get_local_time_str(local_now)}",
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     async def _show_watch_menu(self, message, user_config):
-        keyboard = self._get_watch_keyboard(user_config)
-        await message.edit_text(
-            self._get_watch_text(user_config),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
-        )
+        markup = self._get_watch_keyboard(user_config)
+        await self._edit_if_changed(message, self._get_watch_text(user_config), markup)
     
     async def _show_profile_menu(self, message, user_config):
-        keyboard = self._get_profile_keyboard(user_config)
-        await message.edit_text(
-            self._get_profile_text(user_config),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
-        )
+        markup = self._get_profile_keyboard(user_config)
+        await self._edit_if_changed(message, self._get_profile_text(user_config), markup)
     
     async def _show_mode_menu(self, message, user_config):
-        keyboard = self._get_mode_keyboard(user_config)
-        await message.edit_text(
-            self._get_mode_text(user_config),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
-        )
+        markup = self._get_mode_keyboard(user_config)
+        await self._edit_if_changed(message, self._get_mode_text(user_config), markup)
     
     async def _show_night_menu(self, message, user_config):
-        keyboard = self._get_night_keyboard(user_config)
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        markup = self._get_night_keyboard(user_config)
+        local_now, is_night, effective_mode = user_config.time_snapshot()
         night = user_config.alert_mode.night
         
         await message.edit_text(
@@ -1875,96 +2254,95 @@ class TelegramBot:
             f"<b>最大重复:</b> {night.night_max_repeats} 次\n"
             f"<b>夜间加邮件:</b> {'✅' if night.night_add_email else '❌'}\n\n"
             f"💡 夜间模式开启后，在夜间时段会自动切换为<b>重复提醒</b>模式\n\n"
-            f"⏰ {user_config.get_local_time_str()}",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            f"⏰ {user_config.get_local_time_str(local_now)}",
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     async def _show_email_menu(self, message, user_config):
-        keyboard = self._get_email_keyboard(user_config)
+        markup = self._get_email_keyboard(user_config)
         emails = ', '.join(user_config.email.to_addresses) or '未设置'
         channels = [c.value for c in user_config.notify_channels]
         
-        await message.edit_text(
+        text = (
             f"📧 <b>邮件设置</b>\n\n"
             f"状态: {'✅ 已启用' if user_config.email.enabled else '❌ 未启用'}\n"
             f"邮箱: {emails}\n"
             f"通知渠道: {channels}\n\n"
-            f"设置: <code>/email your@email.com</code>",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
+            f"设置: <code>/email your@email.com</code>"
         )
+        await self._edit_if_changed(message, text, markup)
     
     async def _show_timezone_menu(self, message, user_config):
-        keyboard = []
-        row = []
-        for name, offset in TIMEZONE_PRESETS.items():
-            check = "✅" if user_config.timezone_offset == offset else ""
-            btn = InlineKeyboardButton(f"{check}{name}", callback_data=f"tz_{offset}_{name}")
-            row.append(btn)
-            if len(row) == 2:
-                keyboard.append(row)
-                row = []
-        if row:
-            keyboard.append(row)
-        keyboard.append([InlineKeyboardButton("◀️ 返回", callback_data="back_menu")])
+        markup = _build_timezone_markup(user_config.timezone_offset)
         
         await message.edit_text(
             f"🌍 <b>时区设置</b>\n\n"
             f"当前: <b>{user_config.timezone_name}</b>\n"
             f"时间: {user_config.get_local_time_str()}\n\n"
             f"选择时区或输入: <code>/tz 8</code>",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=markup,
             parse_mode=ParseMode.HTML
         )
     
     async def _show_switches_menu(self, message, user_config):
-        keyboard = [
-            [InlineKeyboardButton(f"{'✅' if user_config.enable_spot else '⬜'} 现货报警", callback_data="toggle_spot")],
-            [InlineKeyboardButton(f"{'✅' if user_config.enable_futures else '⬜'} 合约报警", callback_data="toggle_futures")],
-            [InlineKeyboardButton(f"{'✅' if user_config.enable_spread else '⬜'} 差价报警", callback_data="toggle_spread")],
-            [InlineKeyboardButton(f"{'✅' if user_config.enable_volume else '⬜'} 成交量异动", callback_data="toggle_volume")],
-            [InlineKeyboardButton(f"{'✅' if user_config.enable_funding else '⬜'} 资金费率", callback_data="toggle_funding")],
-            [InlineKeyboardButton(f"{'✅' if user_config.enable_big_order else '⬜'} 🐋 巨量挂单", callback_data="toggle_big_order")],
-            [InlineKeyboardButton(
-                f"💎 成交额筛选: {user_config.get_volume_filter_display()}", 
-                callback_data="menu_volume_filter"
-            )],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
+        volume_display = user_config.get_volume_filter_display()
+        flags = (
+            user_config.enable_spot, user_config.enable_futures, user_config.enable_spread,
+            user_config.enable_volume, user_config.enable_funding, user_config.enable_big_order,
+        )
+        check = _CHECK
         
-        await message.edit_text(
-            f"🎚️ <b>监控类型设置</b>\n\n"
-            f"<b>报警开关:</b>\n"
-            f"• 现货: {'✅' if user_config.enable_spot else '❌'}\n"
-            f"• 合约: {'✅' if user_config.enable_futures else '❌'}\n"
-            f"• 差价: {'✅' if user_config.enable_spread else '❌'}\n"
-            f"• 成交量异动: {'✅' if user_config.enable_volume else '❌'}\n"
-            f"• 资金费率: {'✅' if user_config.enable_funding else '❌'}\n"
-            f"• 🐋 巨量挂单: {'✅' if user_config.enable_big_order else '❌'}\n\n"
-            f"<b>成交额筛选:</b> {user_config.get_volume_filter_display()}\n"
-            f"{'💡 已开启，仅监控大成交额代币' if user_config.volume_filter_enabled else '💡 未开启，监控所有代币'}\n\n"
-            f"<b>💡 巨量挂单说明:</b>\n"
-            f"检测订单簿中的超大额买/卖挂单\n"
-            f"• 小市值币: ≥$500K 或占24h成交额20%\n"
-            f"• 大市值币: ≥$5M 或占24h成交额5%",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
+        text = _SWITCHES_TEMPLATE % (
+            *(check[f] for f in flags),
+            volume_display,
+            _VOLUME_FILTER_HINT[user_config.volume_filter_enabled],
         )
+        await self._edit_if_changed(message, text, _build_switches_markup(*flags, volume_display))
+    
+    def _schedule_edit(self, message: Message, render, delay: float = EDIT_COALESCE_DELAY):
+        """
+        合并同一条消息的重绘: 窗口内再次调度会取消上一次，
+        render 在触发时才执行，因此按最新的用户状态渲染
+        """
+        key = (message.chat_id, message.message_id)
+        handle = self._pending_edits.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._pending_edits[key] = loop.call_later(delay, self._fire_edit, key, render)
+    
+    def _fire_edit(self, key: Tuple[int, int], render):
+        self._pending_edits.pop(key, None)
+        task = asyncio.create_task(self._run_edit(render))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+    
+    async def _run_edit(self, render):
+        try:
+            await render()
+        except BadRequest as e:
+            logger.debug(f"合并重绘失败: {e}")
+        except Exception as e:
+            logger.error(f"合并重绘错误: {e}")
+    
+    async def _edit_if_changed(self, message: Message, text: str, markup: InlineKeyboardMarkup):
+        """内容和键盘都与当前消息相同时跳过编辑，省去一次必然失败的请求"""
+        if message.reply_markup == markup and message.text_html == text.strip():
+            return
+        await message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
     
     async def _show_volume_filter_menu(self, message, user_config):
         """显示成交额筛选菜单"""
-        keyboard = self._get_volume_filter_keyboard(user_config)
-        
-        await message.edit_text(
+        markup = self._get_volume_filter_keyboard(user_config)
+        text = (
             f"💎 <b>24H成交额筛选</b>\n\n"
             f"<b>当前状态:</b> {'✅ 已开启' if user_config.volume_filter_enabled else '❌ 未开启'}\n"
             f"<b>最低成交额:</b> {user_config.get_volume_filter_display()}\n\n"
             f"💡 开启后，只有24小时成交额达到设定值的代币才会触发报警\n"
-            f"适合过滤小币种，专注主流币",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
+            f"适合过滤小币种，专注主流币"
         )
+        await self._edit_if_changed(message, text, markup)
     
     async def _show_list_menu(self, message, user_config, list_type):
         items = user_config.whitelist if list_type == "whitelist" else user_config.blacklist
@@ -1981,47 +2359,21 @@ class TelegramBot:
             [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
         ]
         
-        await message.edit_text(
+        text = (
             f"{title}\n\n{items_text}\n\n"
             f"<code>/{cmd} add BTC ETH</code>\n"
-            f"<code>/{cmd} del BTC</code>",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
+            f"<code>/{cmd} del BTC</code>"
         )
+        await self._edit_if_changed(message, text, InlineKeyboardMarkup(keyboard))
     
     async def _show_rank_menu(self, message, user_config):
-        keyboard = [
-            # 现货
-            [InlineKeyboardButton("━━━ 📈 现货 ━━━", callback_data="noop")],
-            [
-                InlineKeyboardButton("🟢 涨幅", callback_data="rank_gainers_spot"),
-                InlineKeyboardButton("🔴 跌幅", callback_data="rank_losers_spot"),
-                InlineKeyboardButton("💰 成交额", callback_data="rank_volume_spot"),
-            ],
-            # 合约
-            [InlineKeyboardButton("━━━ 📊 合约 ━━━", callback_data="noop")],
-            [
-                InlineKeyboardButton("🟢 涨幅", callback_data="rank_gainers_futures"),
-                InlineKeyboardButton("🔴 跌幅", callback_data="rank_losers_futures"),
-                InlineKeyboardButton("💰 成交额", callback_data="rank_volume_futures"),
-            ],
-            # 期现数据
-            [InlineKeyboardButton("━━━ 📐 期现 ━━━", callback_data="noop")],
-            [
-                InlineKeyboardButton("📐 差价", callback_data="rank_spread"),
-                InlineKeyboardButton("📈 费率+", callback_data="rank_funding_pos"),
-                InlineKeyboardButton("📉 费率-", callback_data="rank_funding_neg"),
-            ],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
-        
         await message.edit_text(
             f"📊 <b>实时排行榜</b>\n\n"
             f"📈 现货 - Binance现货市场\n"
             f"📊 合约 - Binance U本位合约\n"
             f"📐 期现 - 现货合约对比数据\n\n"
             f"⏰ {user_config.get_local_time_str()}",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=_RANK_MENU_MARKUP,
             parse_mode=ParseMode.HTML
         )
     
@@ -2031,102 +2383,54 @@ class TelegramBot:
         
         if not pending:
             keyboard = [[InlineKeyboardButton("◀️ 返回", callback_data="back_menu")]]
-            await message.edit_text(
-                "✅ 没有待确认的报警",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.HTML
-            )
+            await self._edit_if_changed(message, "✅ 没有待确认的报警", InlineKeyboardMarkup(keyboard))
             return
         
-        text = f"🔔 <b>待确认报警 ({len(pending)})</b>\n\n"
-        
-        for alert_id, alert in list(pending.items())[:5]:
-            text += f"• <code>{alert_id}</code> {alert.symbol}\n"
-            text += f"  {alert.message[:20]}... (已发{alert.sent_count}次)\n\n"
+        # 只取一次前 5 条，文本和按钮共用
+        items = list(islice(pending.items(), 5))
+        parts = [f"🔔 <b>待确认报警 ({len(pending)})</b>\n\n"]
+        parts.extend(
+            f"• <code>{alert_id}</code> {alert.symbol}\n"
+            f"  {alert.message[:20]}... (已发{alert.sent_count}次)\n\n"
+            for alert_id, alert in items
+        )
         
         if len(pending) > 5:
-            text += f"... 还有 {len(pending) - 5} 个\n"
+            parts.append(f"... 还有 {len(pending) - 5} 个\n")
+        text = "".join(parts)
         
         keyboard = [
             [InlineKeyboardButton("✅ 确认全部", callback_data="confirm_all_alerts")],
         ]
         
-        for alert_id, alert in list(pending.items())[:3]:
-            name = alert.symbol.replace('USDT', '')
+        for alert_id, alert in items[:3]:
             keyboard.append([
                 InlineKeyboardButton(
-                    f"✅ 确认 {name}", 
+                    f"✅ 确认 {alert.symbol[:-4]}", 
                     callback_data=f"confirm_alert_{alert_id}"
                 )
             ])
         
         keyboard.append([InlineKeyboardButton("◀️ 返回", callback_data="back_menu")])
         
-        await message.edit_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.HTML
-        )
+        await self._edit_if_changed(message, text, InlineKeyboardMarkup(keyboard))
     
     # ================== 辅助方法 ==================
     
     def _parse_symbols(self, args):
-        symbols = []
-        for s in args:
-            s = s.upper().strip()
-            if not s.endswith('USDT'):
-                s += 'USDT'
-            symbols.append(s)
-        return symbols
-    
-    def _get_main_menu_keyboard(self):
-        return [
-            [
-                InlineKeyboardButton("📊 排行榜", callback_data="menu_rank"),
-                InlineKeyboardButton("🔔 待确认", callback_data="menu_pending"),
-            ],
-            [
-                InlineKeyboardButton("🌍 时区", callback_data="menu_timezone"),
-                InlineKeyboardButton("👁️ 监控", callback_data="menu_watch"),
-            ],
-            [
-                InlineKeyboardButton("🎯 灵敏度", callback_data="menu_profile"),
-                InlineKeyboardButton("🔔 模式", callback_data="menu_mode"),
-            ],
-            [
-                InlineKeyboardButton("✅ 白名单", callback_data="menu_whitelist"),
-                InlineKeyboardButton("🚫 黑名单", callback_data="menu_blacklist"),
-            ],
-            [
-                InlineKeyboardButton("🌙 夜间模式", callback_data="menu_night"),
-                InlineKeyboardButton("📧 邮件", callback_data="menu_email"),
-            ],
-            [
-                InlineKeyboardButton("⚙️️ 监控类型", callback_data="menu_switches"),
-            ],
-        ]
+        return [_norm(s) for s in args]
     
-    def _get_watch_keyboard(self, user_config):
-        return [
-            [InlineKeyboardButton(f"{'✅' if user_config.watch_mode == 'all' else '⬜'} 全部", callback_data="watch_all")],
-            [InlineKeyboardButton(f"{'✅' if user_config.watch_mode == 'whitelist' else '⬜'} 仅白名单", callback_data="watch_whitelist")],
-            [InlineKeyboardButton(f"{'✅' if user_config.watch_mode == 'blacklist' else '⬜'} 排除黑名单", callback_data="watch_blacklist")],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
+    def _get_main_menu_keyboard(self) -> InlineKeyboardMarkup:
+        return _MAIN_MENU_MARKUP
     
-    def _get_profile_keyboard(self, user_config):
-        return [
-            [InlineKeyboardButton(f"{'✅' if user_config.profile == AlertProfile.CONSERVATIVE else '⬜'} 🟢 保守", callback_data="profile_conservative")],
-            [InlineKeyboardButton(f"{'✅' if user_config.profile == AlertProfile.MODERATE else '⬜'} 🟡 适中", callback_data="profile_moderate")],
-            [InlineKeyboardButton(f"{'✅' if user_config.profile == AlertProfile.AGGRESSIVE else '⬜'} 🔴 激进", callback_data="profile_aggressive")],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
+    def _get_watch_keyboard(self, user_config) -> InlineKeyboardMarkup:
+        return _build_watch_markup(user_config.watch_mode)
     
-    def _get_email_keyboard(self, user_config):
-        return [
-            [InlineKeyboardButton(f"{'🔴 关闭' if user_config.email.enabled else '🟢 开启'} 邮件", callback_data="toggle_email")],
-            [InlineKeyboardButton("◀️ 返回", callback_data="back_menu")],
-        ]
+    def _get_profile_keyboard(self, user_config) -> InlineKeyboardMarkup:
+        return _build_profile_markup(user_config.profile)
+    
+    def _get_email_keyboard(self, user_config) -> InlineKeyboardMarkup:
+        return _build_email_markup(user_config.email.enabled)
     
     def _get_watch_text(self, user_config):
         return f"""
@@ -2161,8 +2465,7 @@ class TelegramBot:
 """
     
     def _get_mode_text(self, user_config):
-        is_night = user_config.is_night_time()
-        effective_mode = user_config.get_effective_mode()
+        _, is_night, effective_mode = user_config.time_snapshot()
         night = user_config.alert_mode.night
         
         return f"""
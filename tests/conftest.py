@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# 模块都在仓库根目录，测试直接按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config 导入时会在当前目录创建全局 UserManager (data/users.db)，
+# 切到临时目录，避免读写仓库里的 data/
+os.chdir(tempfile.mkdtemp(prefix="coinwhistle-test-"))
@@ -0,0 +1,97 @@
+"""用户存储测试 (SQLite + users.json 迁移)"""
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+pytest.importorskip("loguru")
+
+import config
+from config import UserManager
+
+
+def _db_rows(data_dir):
+    db = sqlite3.connect(str(data_dir / "users.db"))
+    try:
+        return {uid: json.loads(data) for uid, data in db.execute("SELECT user_id, data FROM users")}
+    finally:
+        db.close()
+
+
+def test_migrate_users_json(tmp_path):
+    (tmp_path / "users.json").write_text(json.dumps({
+        "1001": {
+            "user_id": "1001",
+            "username": "alice",
+            "chat_id": "1001",
+            "timezone_offset": 9,
+            "timezone_name": "东京",
+            "whitelist": ["btcusdt"],
+            "alert_mode": {"mode": "repeat", "night": {"enabled": True}},
+        },
+        "1002": {"user_id": "1002", "chat_id": "1002", "is_active": False},
+    }, ensure_ascii=False), encoding="utf-8")
+    
+    manager = UserManager(data_dir=str(tmp_path))
+    
+    assert set(manager.users) == {"1001", "1002"}
+    assert manager.count_active() == 1
+    rows = _db_rows(tmp_path)
+    assert set(rows) == {"1001", "1002"}
+    assert rows["1001"]["whitelist"] == ["BTCUSDT"]
+    
+    # 数据库非空后不再读取 users.json
+    (tmp_path / "users.json").unlink()
+    reloaded = UserManager(data_dir=str(tmp_path)).get_user("1001")
+    assert reloaded.timezone_offset == 9
+    assert reloaded.alert_mode.mode == config.AlertMode.REPEAT
+    assert reloaded.alert_mode.night.enabled
+
+
+def test_upsert_round_trip(tmp_path):
+    manager = UserManager(data_dir=str(tmp_path))
+    manager.get_or_create_user("42", "bob", "42")
+    manager.set_timezone("42", 3, "莫斯科")
+    manager.add_to_blacklist("42", ["ETHUSDT"])
+    
+    rows = _db_rows(tmp_path)
+    assert list(rows) == ["42"]
+    
+    reloaded = UserManager(data_dir=str(tmp_path)).get_user("42")
+    assert reloaded.username == "bob"
+    assert reloaded.timezone_offset == 3
+    assert reloaded.timezone_name == "莫斯科"
+    assert reloaded.blacklist == ["ETHUSDT"]
+
+
+def test_failed_write_is_retried(tmp_path, monkeypatch):
+    manager = UserManager(data_dir=str(tmp_path))
+    manager.get_or_create_user("7", "carol", "7")
+    
+    real_write = manager._write
+    calls = []
+    
+    def flaky_write(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        real_write(rows)
+    
+    monkeypatch.setattr(manager, "_write", flaky_write)
+    
+    async def scenario():
+        manager.set_timezone("7", 10, "悉尼")
+        await manager.flush()
+        # 第一次写入失败: 用户仍在待写集合，并已安排重试
+        assert "7" in manager._dirty
+        assert manager._save_handle is not None
+        assert _db_rows(tmp_path)["7"]["timezone_offset"] == 8
+        
+        await manager.flush()
+        assert not manager._dirty
+    
+    asyncio.run(scenario())
+    
+    assert len(calls) == 2
+    assert _db_rows(tmp_path)["7"]["timezone_offset"] == 10
@@ -0,0 +1,24 @@
+"""回调解析测试"""
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("loguru")
+
+
+@pytest.fixture
+def bot_module():
+    import telegram_bot
+    return telegram_bot
+
+
+@pytest.mark.parametrize("data, action, sym, mins", [
+    ("mute_symbol_BTCUSDT_30", "mute_symbol", "BTCUSDT", "30"),
+    ("mute_symbol_BTCUSDT", "mute_symbol", "BTCUSDT", None),
+    ("extend_mute_1000PEPEUSDT_60", "extend_mute", "1000PEPEUSDT", "60"),
+    ("mute_symbol_币安人生USDT_30", "mute_symbol", "币安人生USDT", "30"),
+    ("extend_mute_币安人生USDT", "extend_mute", "币安人生USDT", None),
+])
+def test_mute_callback_parse(bot_module, data, action, sym, mins):
+    m = bot_module._MUTE_CB_RE.fullmatch(data)
+    assert m is not None
+    assert (m['action'], m['sym'], m['mins']) == (action, sym, mins)